@@ -1,14 +1,41 @@
-from .recipe_inputs import get_urls_from_esgf
-import logging
-import backoff  # noqa #https://github.com/litl/backoff/issues/71
+import importlib
+from typing import TYPE_CHECKING
 
 try:
     from ._version import __version__
 except ImportError:
     __version__ = "unknown"
 
-logging.getLogger("backoff").setLevel(logging.FATAL)
-# not sure if this is needed, but I want to avoid the many backoff messages
+# The functions making requests pull in aiohttp, backoff and tqdm, which are slow to import.
+# They are only loaded on first access, so that e.g. `pangeo_forge_esgf.utils` stays fast to import.
+_lazy_imports = {
+    "get_urls_from_esgf": "recipe_inputs",
+    "generate_recipe_inputs_from_iids": "recipes",
+}
+
+if TYPE_CHECKING:
+    from .recipe_inputs import get_urls_from_esgf
+    from .recipes import generate_recipe_inputs_from_iids
+
+__all__ = [
+    "__version__",
+    "get_urls_from_esgf",
+    "generate_recipe_inputs_from_iids",
+    "setup_logging",
+]
+
+
+def __getattr__(name: str):
+    if name in _lazy_imports:
+        module = importlib.import_module(f".{_lazy_imports[name]}", __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_imports))
 
 
 def setup_logging(level: str = "INFO"):
@@ -0,0 +1,282 @@
+"""Command line interface to resolve (wildcard) instance ids to urls in batch jobs.
+
+Heavy dependencies (aiohttp, tqdm, requests) are only imported once a job runs,
+so that `--help` and argument errors stay fast.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Optional, TextIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def is_pattern(iid: str) -> bool:
+    """Check if an iid needs to be parsed with `parse_instance_ids` first"""
+    return "*" in iid or "[" in iid
+
+
+def read_iids(lines: Iterable[str]) -> List[str]:
+    """Read iids (or iid patterns) one per line, skipping empty lines and `#` comments"""
+    iids = []
+    for line in lines:
+        line = line.split("#", 1)[0].strip()
+        if line:
+            iids.append(line)
+    return iids
+
+
+def host_rate(value: str) -> Tuple[str, float]:
+    """Parse a `HOST=RATE` command line argument"""
+    host, sep, rate = value.rpartition("=")
+    try:
+        if not sep or not host:
+            raise ValueError
+        return host, positive_rate(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"Expected HOST=RATE with a positive RATE, got {value!r}"
+        )
+
+
+def positive_rate(value: str) -> float:
+    """Parse a rate in requests per second, which has to be positive"""
+    rate = float(value)
+    if not rate > 0:
+        raise ValueError(f"Rate must be positive, got {value!r}")
+    return rate
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="pangeo-forge-esgf",
+        description=(
+            "Resolve ESGF instance ids (wildcards and square brackets are allowed) to urls. "
+            "Results are written as JSON Lines ({'iid': ..., 'urls': [...]}) as soon as each "
+            "iid is resolved, `urls` is null if no complete url list could be found."
+        ),
+    )
+    parser.add_argument(
+        "input",
+        nargs="?",
+        default="-",
+        help="File with one iid (pattern) per line. Reads from stdin if omitted or '-'.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help="File to write the JSON Lines results to. Writes to stdout if omitted or '-'.",
+    )
+    parser.add_argument(
+        "--search-node",
+        action="append",
+        dest="search_nodes",
+        help="Search node url. Can be given multiple times. Discovered automatically if omitted.",
+    )
+    parser.add_argument(
+        "--search-node-registry",
+        help="Url or file with a list of search nodes to discover responsive nodes from.",
+    )
+    parser.add_argument(
+        "--node-cache",
+        dest="search_node_cache_file",
+        help="File to cache the discovered search nodes in (shared between runs).",
+    )
+    parser.add_argument("--max-concurrency", type=int, default=50)
+    parser.add_argument("--max-concurrency-response", type=int, default=50)
+    parser.add_argument("--limit-per-host", type=int, default=50)
+    parser.add_argument(
+        "--choose-url",
+        default="first",
+        choices=["first", "first_responsive", "fastest"],
+        help="Strategy to choose one url per file.",
+    )
+    parser.add_argument(
+        "--sufficient",
+        action="store_true",
+        help="Stop querying search nodes for an iid once its file set is complete.",
+    )
+    parser.add_argument("--min-confirming-nodes", type=int, default=1)
+    parser.add_argument(
+        "--rate-limit-db",
+        help=(
+            "SQLite file with the request budget per host, shared by all jobs using the same file. "
+            "Requests are only rate limited if this or one of the other rate options is given."
+        ),
+    )
+    parser.add_argument(
+        "--rate-limit",
+        action="append",
+        type=host_rate,
+        dest="rate_limits",
+        metavar="HOST=RATE",
+        help="Requests per second to HOST. Can be given multiple times.",
+    )
+    parser.add_argument(
+        "--default-rate",
+        type=positive_rate,
+        help="Requests per second to all hosts without a --rate-limit (default: 10).",
+    )
+    parser.add_argument(
+        "--progress", default="none", choices=["none", "tqdm", "logging"]
+    )
+    parser.add_argument(
+        "--log-level", default="WARNING", choices=["DEBUG", "INFO", "WARNING"]
+    )
+    return parser
+
+
+async def iids_from_input(
+    iids: List[str],
+    search_nodes: Optional[List[str]],
+    search_node_registry: Optional[str],
+    search_node_cache_file: Optional[str],
+    failed_patterns: List[str],
+) -> AsyncIterator[str]:
+    """Yield plain iids right away, and parse all patterns concurrently (in threads),
+    yielding their iids as soon as each pattern is parsed. Duplicates are dropped."""
+    from .parsing import parse_instance_ids
+
+    seen = set()
+    for iid in iids:
+        if not is_pattern(iid) and iid not in seen:
+            seen.add(iid)
+            yield iid
+
+    async def parse(pattern):
+        try:
+            return pattern, await asyncio.to_thread(
+                parse_instance_ids,
+                pattern,
+                search_nodes=search_nodes,
+                search_node_registry=search_node_registry,
+                search_node_cache_file=search_node_cache_file,
+            )
+        except RuntimeError:
+            # e.g. none of the search nodes are responsive, this fails the whole job
+            raise
+        except Exception as e:
+            logger.warning(f"Parsing {pattern=} failed with {e}")
+            return pattern, []
+
+    for future in asyncio.as_completed([parse(p) for p in iids if is_pattern(p)]):
+        pattern, parsed_iids = await future
+        if len(parsed_iids) == 0:
+            failed_patterns.append(pattern)
+        for iid in parsed_iids:
+            if iid not in seen:
+                seen.add(iid)
+                yield iid
+
+
+def rate_limiter_from_args(args: argparse.Namespace):
+    """Shared rate limiter configured on the command line, or None"""
+    if (
+        args.rate_limit_db is None
+        and not args.rate_limits
+        and args.default_rate is None
+    ):
+        return None
+    from .ratelimit import DEFAULT_RATE_LIMIT_DB, SharedRateLimiter
+
+    kwargs = {} if args.default_rate is None else {"default_rate": args.default_rate}
+    return SharedRateLimiter(
+        path=args.rate_limit_db or DEFAULT_RATE_LIMIT_DB,
+        rates=dict(args.rate_limits or []),
+        **kwargs,
+    )
+
+
+async def run(args: argparse.Namespace, iids: List[str], output: TextIO) -> Dict:
+    """Parse and resolve `iids`, write results to `output` and return a summary"""
+    from .recipe_inputs import iter_urls_from_esgf
+
+    start = time.perf_counter()
+    failed_patterns: List[str] = []
+    failed_iids: List[str] = []
+    n_resolved = 0
+    async for iid, urls in iter_urls_from_esgf(
+        iids_from_input(
+            iids,
+            args.search_nodes,
+            args.search_node_registry,
+            args.search_node_cache_file,
+            failed_patterns,
+        ),
+        limit_per_host=args.limit_per_host,
+        max_concurrency=args.max_concurrency,
+        max_concurrency_response=args.max_concurrency_response,
+        search_nodes=args.search_nodes,
+        choose_url=args.choose_url,
+        sufficient=args.sufficient,
+        min_confirming_nodes=args.min_confirming_nodes,
+        progress=None if args.progress == "none" else args.progress,
+        search_node_registry=args.search_node_registry,
+        search_node_cache_file=args.search_node_cache_file,
+        rate_limiter=rate_limiter_from_args(args),
+    ):
+        output.write(json.dumps({"iid": iid, "urls": urls}) + "\n")
+        output.flush()
+        if urls is None:
+            failed_iids.append(iid)
+        else:
+            n_resolved += 1
+    return {
+        "resolved": n_resolved,
+        "failed_iids": failed_iids,
+        "failed_patterns": failed_patterns,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def print_summary(summary: Dict, file: Optional[TextIO] = None) -> None:
+    file = sys.stderr if file is None else file
+    total = summary["resolved"] + len(summary["failed_iids"])
+    print(
+        f"Resolved {summary['resolved']}/{total} iids in {summary['seconds']:.1f}s",
+        file=file,
+    )
+    for pattern in summary["failed_patterns"]:
+        print(f"No iids found for pattern: {pattern}", file=file)
+    for iid in summary["failed_iids"]:
+        print(f"Failed to resolve: {iid}", file=file)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point of the `pangeo-forge-esgf` console script. Returns 1 if any iid
+    (or pattern) could not be resolved, and 2 if the resolution failed altogether."""
+    args = get_parser().parse_args(argv)
+    logging.basicConfig(
+        level=getattr(logging, args.log_level),
+        format="%(name)s - %(levelname)s - %(message)s",
+        stream=sys.stderr,
+    )
+
+    if args.input == "-":
+        iids = read_iids(sys.stdin)
+    else:
+        with open(args.input) as f:
+            iids = read_iids(f)
+
+    try:
+        if args.output == "-":
+            summary = asyncio.run(run(args, iids, sys.stdout))
+        else:
+            with open(args.output, "w") as output:
+                summary = asyncio.run(run(args, iids, output))
+    except RuntimeError as e:
+        # e.g. none of the search nodes are responsive
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    print_summary(summary)
+    return int(len(summary["failed_iids"]) + len(summary["failed_patterns"]) > 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
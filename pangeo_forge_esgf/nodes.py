@@ -0,0 +1,245 @@
+import aiohttp
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# I am never sure where to get the full list of SOLR indicies, took this from intake-esgf: https://intake-esgf.readthedocs.io/en/latest/configure.html
+# The scheme is left out on purpose, `discover_search_nodes` probes both http and https.
+DEFAULT_SEARCH_NODES = [
+    "esgf-node.llnl.gov/esg-search/search",
+    "esgf-data.dkrz.de/esg-search/search",
+    "esgf.nci.org.au/esg-search/search",
+    "esgf-node.ornl.gov/esg-search/search",
+    "esgf-node.ipsl.upmc.fr/esg-search/search",
+    "esg-dn1.nsc.liu.se/esg-search/search",
+    "esgf.ceda.ac.uk/esg-search/search",
+    "esgf-index1.ceda.ac.uk/esg-search/search",
+]
+SEARCH_NODE_CACHE_TTL = 3600  # in seconds
+
+# shared between `parse_instance_ids` and `get_urls_from_esgf`
+_search_node_cache: Dict[str, Tuple[float, List[str]]] = {}
+_discovery_thread_lock = threading.Lock()
+
+
+def strip_scheme(url: str) -> str:
+    return url.split("://", 1)[-1]
+
+
+def parse_node_list(text: str) -> List[str]:
+    """Parse a list of search nodes from a registry or config file.
+    Accepts a json list, a json dict with a `search_nodes` entry, or one node per line
+    (lines starting with `#` are ignored).
+    """
+    try:
+        content = json.loads(text)
+    except json.JSONDecodeError:
+        return [
+            line.strip()
+            for line in text.splitlines()
+            if line.strip() and not line.strip().startswith("#")
+        ]
+    if isinstance(content, dict):
+        content = content["search_nodes"]
+    if not isinstance(content, list):
+        raise ValueError(f"Could not parse a list of search nodes from {content=}")
+    return [str(node) for node in content]
+
+
+async def read_node_list(
+    session: aiohttp.ClientSession, registry: str, timeout: int = 10
+) -> List[str]:
+    """Read search node candidates from a federation registry (http(s) url) or a local config file."""
+    if registry.startswith(("http://", "https://")):
+        async with session.get(
+            registry,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            raise_for_status=True,
+        ) as resp:
+            text = await resp.text()
+    else:
+        with open(registry) as f:
+            text = f.read()
+    return parse_node_list(text)
+
+
+async def probe_url(
+    session: aiohttp.ClientSession, url: str, timeout: int
+) -> Optional[float]:
+    """Returns the time in seconds for a minimal search request, or None if the node is not responsive."""
+    params = {"limit": "0", "format": "application/solr+json"}
+    start = time.perf_counter()
+    try:
+        async with session.get(
+            url, params=params, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as resp:
+            if resp.status >= 300:
+                logger.debug(f"Probing {url=} returned {resp.status}")
+                return None
+            await resp.read()
+    except Exception as e:
+        logger.debug(f"Probing {url=} failed with: {e}")
+        return None
+    return time.perf_counter() - start
+
+
+async def probe_search_node(
+    session: aiohttp.ClientSession, node: str, timeout: int = 10
+) -> Optional[Tuple[float, str]]:
+    """Probe a search node via http and https concurrently and return (latency, url)
+    for the faster working scheme, or None if neither works."""
+    urls = [f"{scheme}://{strip_scheme(node)}" for scheme in ["https", "http"]]
+    latencies = await asyncio.gather(
+        *[probe_url(session, url, timeout) for url in urls]
+    )
+    working = [(lat, url) for lat, url in zip(latencies, urls) if lat is not None]
+    if len(working) == 0:
+        return None
+    return min(working)
+
+
+def _cache_key(candidates: List[str]) -> str:
+    return ",".join(sorted(set(strip_scheme(c) for c in candidates)))
+
+
+def _read_cache_file(cache_file: str) -> Dict[str, Tuple[float, List[str]]]:
+    try:
+        with open(cache_file) as f:
+            return {k: (v["time"], v["search_nodes"]) for k, v in json.load(f).items()}
+    except (OSError, ValueError, KeyError, AttributeError) as e:
+        logger.debug(f"Could not read search node cache from {cache_file=}: {e}")
+        return {}
+
+
+def _write_cache_file(
+    cache_file: str, cache: Dict[str, Tuple[float, List[str]]]
+) -> None:
+    content = {k: {"time": t, "search_nodes": nodes} for k, (t, nodes) in cache.items()}
+    cache_dir = os.path.dirname(os.path.abspath(cache_file))
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(content, f)
+    os.replace(tmp_file, cache_file)
+
+
+def _cached_search_nodes(
+    key: str, ttl: float, cache_file: Optional[str]
+) -> Optional[List[str]]:
+    if key not in _search_node_cache and cache_file is not None:
+        _search_node_cache.update(_read_cache_file(cache_file))
+    if key in _search_node_cache:
+        timestamp, nodes = _search_node_cache[key]
+        if time.time() - timestamp < ttl:
+            return list(nodes)
+    return None
+
+
+@asynccontextmanager
+async def _discovery_lock() -> AsyncIterator[None]:
+    """Only one discovery runs at a time, also across threads (e.g. `parse_instance_ids`
+    called from several threads, each with its own event loop). Polls instead of blocking,
+    so that the event loop keeps running while waiting."""
+    while not _discovery_thread_lock.acquire(blocking=False):
+        await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        _discovery_thread_lock.release()
+
+
+async def discover_search_nodes(
+    candidates: Optional[List[str]] = None,
+    registry: Optional[str] = None,
+    session: Optional[aiohttp.ClientSession] = None,
+    timeout: int = 10,
+    ttl: float = SEARCH_NODE_CACHE_TTL,
+    cache_file: Optional[str] = None,
+    refresh: bool = False,
+) -> List[str]:
+    """Find responsive search nodes.
+
+    Candidates are taken from `candidates`, a `registry` (url or config file,
+    see `parse_node_list`) or `DEFAULT_SEARCH_NODES`. All candidates are probed
+    concurrently via http and https, and the faster working url of each node is
+    returned, sorted by latency. Results are cached in memory (and in `cache_file`
+    if given) for `ttl` seconds, unless `refresh` is True. Concurrent calls wait for
+    a running discovery and use its results.
+    """
+    if candidates is not None:
+        key = _cache_key(candidates)
+    elif registry is not None:
+        # keyed on the registry itself, so that it is only read if there is no fresh entry
+        key = f"registry:{registry}"
+    else:
+        key = _cache_key(DEFAULT_SEARCH_NODES)
+
+    async with _discovery_lock():
+        if not refresh:
+            cached = _cached_search_nodes(key, ttl, cache_file)
+            if cached is not None:
+                logger.debug(f"Using cached search nodes {cached}")
+                return cached
+
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                search_nodes = await _probe_candidates(
+                    session, candidates, registry, timeout
+                )
+        else:
+            search_nodes = await _probe_candidates(
+                session, candidates, registry, timeout
+            )
+
+        # never cache a completely unresponsive federation
+        if len(search_nodes) > 0:
+            _search_node_cache[key] = (time.time(), search_nodes)
+            if cache_file is not None:
+                _write_cache_file(cache_file, _search_node_cache)
+    return list(search_nodes)
+
+
+async def _probe_candidates(
+    session: aiohttp.ClientSession,
+    candidates: Optional[List[str]],
+    registry: Optional[str],
+    timeout: int,
+) -> List[str]:
+    if candidates is None:
+        if registry is not None:
+            candidates = await read_node_list(session, registry, timeout=timeout)
+        else:
+            candidates = DEFAULT_SEARCH_NODES
+
+    logger.info(f"Probing {len(candidates)} search nodes")
+    probed = await asyncio.gather(
+        *[probe_search_node(session, node, timeout=timeout) for node in candidates]
+    )
+    search_nodes = [url for _, url in sorted(p for p in probed if p is not None)]
+    if len(search_nodes) == 0:
+        logger.warning(
+            f"None of the candidate search nodes are responsive: {candidates}"
+        )
+    else:
+        logger.info(f"Found responsive {search_nodes=}")
+    return search_nodes
+
+
+def get_search_nodes(**kwargs) -> List[str]:
+    """Synchronous version of `discover_search_nodes`."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(discover_search_nodes(**kwargs))
+    # e.g. in Jupyter there is already a running event loop
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, discover_search_nodes(**kwargs)).result()
@@ -1,11 +1,15 @@
-import requests
+import logging
 import warnings
-from typing import Optional, List
+from typing import Dict, Optional, List, Tuple
 
-from .utils import facets_from_iid
+from .utils import get_naming_schema, normalize_version
+
+logger = logging.getLogger(__name__)
 
 
 def request_from_facets(url, **facets):
+    import requests
+
     params = {
         "type": "Dataset",
         "retracted": "false",
@@ -25,6 +29,88 @@ def instance_ids_from_request(json_dict):
     return uniqe_iids
 
 
+def split_facets(facet_string: str) -> List[str]:
+    """Split an iid pattern on `.`, but not within square brackets"""
+    facets = []
+    depth = 0
+    current = ""
+    for char in facet_string:
+        if char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+        if char == "." and depth == 0:
+            facets.append(current)
+            current = ""
+        else:
+            current += char
+    facets.append(current)
+    return facets
+
+
+def facet_query_from_iid_pattern(
+    facet_string: str, project: Optional[str] = None
+) -> Dict[str, List[str]]:
+    """Translate an iid pattern like `CMIP6.PMIP.*.*.lgm.*.*.[uo, vo].*.*` into a
+    structured facet query (facet -> list of accepted values). Wildcards are left out,
+    so that everything is requested for that facet.
+    """
+    schema = get_naming_schema(project, facet_string)
+    values = split_facets(facet_string)
+    if len(values) != len(schema.facet_names):
+        raise ValueError(
+            f"Found {len(values)} facets in `iid`, but expected {len(schema.facet_names)}. Got {values=}"
+        )
+    query: Dict[str, List[str]] = {}
+    for name, value in zip(schema.facet_names, values):
+        if value.startswith("[") and value.endswith("]"):
+            options = [v.strip() for v in value[1:-1].split(",")]
+        else:
+            options = [value]
+        if "*" in options:
+            continue
+        if name == "version":
+            options = [normalize_version(v) for v in options]
+        query[name] = options
+    return query
+
+
+def iid_matches_pattern(iid: str, pattern: str) -> bool:
+    """Check if `iid` matches a pattern without square brackets (`*` matches any facet value)"""
+    iid_split = iid.split(".")
+    pattern_split = pattern.split(".")
+    if len(iid_split) != len(pattern_split):
+        return False
+    return all(p == "*" or p == i for i, p in zip(iid_split, pattern_split))
+
+
+def instance_ids_from_node(
+    url: str, facet_query: Dict[str, List[str]], limit: int = 500
+) -> Tuple[List[str], bool]:
+    """Request all instance ids matching `facet_query` from a single search node.
+    Multiple values per facet are sent as one multi-valued request and results are
+    paginated. Returns the iids and whether all requests succeeded. If a request fails,
+    the iids from the pages fetched before are still returned.
+    """
+    iids: List[str] = []
+    offset = 0
+    while True:
+        try:
+            resp = request_from_facets(url, limit=limit, offset=offset, **facet_query)
+            if resp.status_code != 200:
+                logger.warning(f"Request [{resp.url}] failed with {resp.status_code}")
+                return list(set(iids)), False
+            json_dict = resp.json()
+            iids.extend(instance_ids_from_request(json_dict))
+            docs = json_dict["response"]["docs"]
+            offset += len(docs)
+            if len(docs) == 0 or offset >= int(json_dict["response"]["numFound"]):
+                return list(set(iids)), True
+        except Exception as e:
+            logger.warning(f"Request to {url=} with {offset=} failed with {e}")
+            return list(set(iids)), False
+
+
 def split_square_brackets(facet_string: str) -> List[str]:
     ## split a string like this `a.[b1, b2].c.[d1, d2]` into a list like this: ['a.b1.c.d1', 'a.b1.c.d2', 'a.b2.c.d1', 'a.b2.c.d2']
     if "[" not in facet_string:
@@ -52,8 +138,13 @@ def parse_instance_ids(
     iid_string: str,
     search_nodes: Optional[list[str]] = None,
     search_node: Optional[str] = None,
+    search_node_registry: Optional[str] = None,
+    search_node_cache_file: Optional[str] = None,
 ) -> list[str]:
-    """Parse an instance id with wildcards"""
+    """Parse an instance id with wildcards.
+    If no `search_nodes` are given, responsive nodes are discovered (and cached) with
+    `pangeo_forge_esgf.nodes.get_search_nodes`, optionally from a `search_node_registry`.
+    """
     if search_node is not None:
         warnings.warn(
             "`search_node` is being deprecated. Please provide a list of urls to `search_nodes` instead",
@@ -63,47 +154,43 @@ def parse_instance_ids(
         if search_nodes is None:
             search_nodes = [search_node]
 
-    # I am never sure where to get the full list of SOLR indicies, took this from intake-esgf: https://intake-esgf.readthedocs.io/en/latest/configure.html
     if search_nodes is None:
-        search_nodes = [
-            "https://esgf-node.llnl.gov/esg-search/search",
-            "https://esgf-data.dkrz.de/esg-search/search",
-            "https://esgf.nci.org.au/esg-search/search",
-            "https://esgf-node.ornl.gov/esg-search/search",
-            "https://esgf-node.ipsl.upmc.fr/esg-search/search",
-            "https://esg-dn1.nsc.liu.se/esg-search/search",
-            "https://esgf.ceda.ac.uk/esg-search/search",
-        ]
-
-    # first resolve the square brackets
-    split_iids: List[str] = split_square_brackets(iid_string)
+        from .nodes import DEFAULT_SEARCH_NODES, get_search_nodes
+
+        search_nodes = get_search_nodes(
+            registry=search_node_registry, cache_file=search_node_cache_file
+        )
+        if len(search_nodes) == 0:
+            candidates = (
+                f"registry {search_node_registry}"
+                if search_node_registry is not None
+                else f"{DEFAULT_SEARCH_NODES}"
+            )
+            raise RuntimeError(f"None of the search nodes {candidates} are responsive")
+
+    # square brackets are sent as multi-valued facet constraints, so this is one request per node
+    facet_query = facet_query_from_iid_pattern(iid_string)
 
     parsed_iids: List[str] = []
-    no_result_iids: List[str] = []
-    for iid in split_iids:
-        for node in search_nodes:
-            facets = facets_from_iid(iid)
-            facets_filtered = {
-                k: v for k, v in facets.items() if v != "*"
-            }  # leaving out the wildcards here will just request everything for that facet
-            try:
-                resp = request_from_facets(node, **facets_filtered)
-                if resp.status_code != 200:
-                    print(f"Request [{resp.url}] failed with {resp.status_code}")
-                else:
-                    json_dict = resp.json()
-                    iids_from_request = instance_ids_from_request(json_dict)
-                    if len(iids_from_request) == 0:
-                        no_result_iids.append(iid)
-                    else:
-                        parsed_iids.extend(iids_from_request)
-            except Exception as e:
-                print(f"Request for {iid=} to {node=} failed with {e}")
+    for node in search_nodes:
+        iids_from_request, complete = instance_ids_from_node(node, facet_query)
+        parsed_iids.extend(iids_from_request)
+        if not complete:
+            logger.warning(
+                f"Results for {iid_string=} from {node=} are incomplete, "
+                f"keeping the {len(iids_from_request)} iids received before the failure"
+            )
+    parsed_iids = list(set(parsed_iids))
+
     # there is the possibility that an iid is parsed by one node, but not another.
     # TODO: Print some more helpful info per node if needed?
-    # For now lets just make sure that no_result_iids only shows cases that fail on *every* node
-    parsed_iids = list(set(parsed_iids))
-    no_result_iids = list(set(no_result_iids) - set(parsed_iids))
+    # Only the expanded square brackets that did not match any result on *any* node are reported
+    split_iids: List[str] = split_square_brackets(iid_string)
+    no_result_iids = [
+        iid
+        for iid in split_iids
+        if not any(iid_matches_pattern(p, iid) for p in parsed_iids)
+    ]
 
     if len(no_result_iids) > 0:
         warnings.warn(f"No parsed results for {no_result_iids=}", UserWarning)
@@ -0,0 +1,171 @@
+import aiohttp
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .ratelimit import SharedRateLimiter
+from .utils import host_from_url
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HostScore:
+    """Result of downloading a small byte range from a data node."""
+
+    host: str
+    url: str
+    ttfb: Optional[float] = None  # time to first byte in seconds
+    throughput: Optional[float] = None  # bytes per second
+    nbytes: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.throughput is not None
+
+
+def representative_urls(
+    iid_url_tuple_list: List[Tuple[str, List[str]]],
+) -> Dict[str, str]:
+    """Pick one url per data node host from the replica lists of all files."""
+    urls: Dict[str, str] = {}
+    for _, replica_urls in iid_url_tuple_list:
+        for url in replica_urls:
+            urls.setdefault(host_from_url(url), url)
+    return urls
+
+
+async def probe_throughput(
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.BoundedSemaphore,
+    url: str,
+    nbytes: int,
+    timeout: int = 10,
+    chunk_size: int = 2**16,
+    rate_limiter: Optional[SharedRateLimiter] = None,
+) -> HostScore:
+    """Download (at most) the first `nbytes` of `url` and measure time to first byte and throughput.
+    Servers that ignore the range request are cut off after `nbytes`.
+    """
+    score = HostScore(host=host_from_url(url), url=url)
+    headers = {"Range": f"bytes=0-{nbytes - 1}"}
+    if rate_limiter is not None:
+        await rate_limiter.acquire(url)
+    async with semaphore:
+        try:
+            start = time.perf_counter()
+            async with session.get(
+                url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as resp:
+                resp.raise_for_status()
+                received = 0
+                first_byte = None
+                async for chunk in resp.content.iter_chunked(chunk_size):
+                    if first_byte is None:
+                        first_byte = time.perf_counter()
+                    received += len(chunk)
+                    if received >= nbytes:
+                        break
+                end = time.perf_counter()
+        except Exception as e:
+            logger.debug(f"Throughput probe for {url=} failed with: {e}")
+            return score
+    if first_byte is None:
+        logger.debug(f"Throughput probe for {url=} returned no data")
+        return score
+    score.ttfb = first_byte - start
+    score.nbytes = received
+    # avoid division by zero for tiny (local) transfers
+    score.throughput = received / max(end - start, 1e-9)
+    logger.debug(f"Throughput probe: {score}")
+    return score
+
+
+class DataNodeProbe:
+    """Probes data node hosts once per host and keeps the per-host scores, so that
+    url selection can prefer the fastest mirror. Reuse an instance to keep the scores
+    across several calls of `get_urls_from_esgf`.
+
+    :param bytes_per_host: Size of the byte range downloaded from each host.
+    :param byte_budget: Total number of bytes downloaded over all hosts. Hosts that are
+      discovered after the budget is used up are not probed.
+    :param timeout: Timeout for each probe in seconds.
+    """
+
+    def __init__(
+        self,
+        bytes_per_host: int = 2**20,
+        byte_budget: int = 50 * 2**20,
+        timeout: int = 10,
+    ):
+        self.bytes_per_host = bytes_per_host
+        self.bytes_remaining = byte_budget
+        self.timeout = timeout
+        self.scores: Dict[str, HostScore] = {}
+        # probes in flight, so that concurrent calls do not probe the same host twice
+        self._probes: Dict[str, asyncio.Future] = {}
+
+    async def probe(
+        self,
+        session: aiohttp.ClientSession,
+        semaphore: asyncio.BoundedSemaphore,
+        iid_url_tuple_list: List[Tuple[str, List[str]]],
+        rate_limiter: Optional[SharedRateLimiter] = None,
+    ) -> Dict[str, HostScore]:
+        """Probe all hosts found in the replica lists that were not probed before (concurrently)."""
+        futures = []
+        started = []
+        for host, url in representative_urls(iid_url_tuple_list).items():
+            if host in self.scores:
+                continue
+            if host not in self._probes:
+                nbytes = min(self.bytes_per_host, self.bytes_remaining)
+                if nbytes <= 0:
+                    logger.debug(f"Byte budget used up, not probing {host=}")
+                    continue
+                self.bytes_remaining -= nbytes
+                self._probes[host] = asyncio.ensure_future(
+                    probe_throughput(
+                        session,
+                        semaphore,
+                        url,
+                        nbytes,
+                        timeout=self.timeout,
+                        rate_limiter=rate_limiter,
+                    )
+                )
+                started.append(host)
+            futures.append(self._probes[host])
+        try:
+            for score in await asyncio.gather(*futures):
+                self.scores[score.host] = score
+        finally:
+            # in-flight probes are only shared within one event loop, finished ones live on in `scores`
+            for host in started:
+                self._probes.pop(host, None)
+        return self.scores
+
+    def rank(self, urls: List[str]) -> List[str]:
+        """Sort urls by the throughput of their host (fastest first). Hosts without a
+        successful probe keep their order after the probed ones."""
+
+        def key(url):
+            score = self.scores.get(host_from_url(url))
+            if score is None or not score.ok:
+                return (1, 0.0)
+            return (0, -score.throughput)
+
+        return sorted(urls, key=key)
+
+
+def filter_urls_fastest(
+    iid_url_tuple_list: List[Tuple[str, List[str]]], data_node_probe: DataNodeProbe
+) -> List[Tuple[str, str]]:
+    """Get the url on the fastest (probed) data node for each file"""
+    filtered_list = []
+    for iid, urls in iid_url_tuple_list:
+        assert len(urls) > 0
+        filtered_list.append((iid, data_node_probe.rank(urls)[0]))
+    return filtered_list
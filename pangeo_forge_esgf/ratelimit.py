@@ -0,0 +1,125 @@
+import asyncio
+import getpass
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import closing
+from typing import Dict, Optional
+
+from .utils import host_from_url
+
+logger = logging.getLogger(__name__)
+
+
+def _user_name() -> str:
+    try:
+        return getpass.getuser()
+    except Exception:
+        # e.g. in containers without an entry for the user id
+        return str(os.getuid())
+
+
+# per user, since the temp directory is shared and the file is only writable by its creator
+DEFAULT_RATE_LIMIT_DB = os.path.join(
+    tempfile.gettempdir(), f"pangeo_forge_esgf_ratelimit_{_user_name()}.sqlite"
+)
+
+
+class SharedRateLimiter:
+    """Token bucket per host, shared between all processes on one machine that use the
+    same SQLite file. Every request to a host has to acquire a token first, so the combined
+    request rate of e.g. several parallel feedstock builds to one search node stays bounded.
+
+    :param path: SQLite file holding the buckets. Defaults to a file per user in the temp
+      directory, so all jobs of a user on one machine share the budget by default.
+    :param rates: Requests per second for specific hosts (or urls), e.g.
+      ``{"esgf-node.llnl.gov": 5}``.
+    :param default_rate: Requests per second for all other hosts.
+    :param burst: Maximum number of tokens that can be saved up per host.
+      Defaults to one second worth of requests.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_RATE_LIMIT_DB,
+        rates: Optional[Dict[str, float]] = None,
+        default_rate: float = 10.0,
+        burst: Optional[float] = None,
+    ):
+        for host, rate in [*(rates or {}).items(), ("default_rate", default_rate)]:
+            if not rate > 0:
+                raise ValueError(f"Rates must be positive, got {rate} for {host}")
+        if burst is not None and not burst >= 1:
+            raise ValueError(
+                f"{burst=} must be at least 1, otherwise no token is ever available"
+            )
+        self.path = path
+        self.rates = {host_from_url(k): v for k, v in (rates or {}).items()}
+        self.default_rate = default_rate
+        self.burst = burst
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(host TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # autocommit mode, transactions are handled explicitly in `try_acquire`
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def rate(self, host: str) -> float:
+        return self.rates.get(host, self.default_rate)
+
+    def capacity(self, host: str) -> float:
+        return self.burst if self.burst is not None else max(1.0, self.rate(host))
+
+    def try_acquire(self, host: str) -> float:
+        """Take a token for `host` if one is available. Returns 0 on success, otherwise the
+        number of seconds until the next token becomes available."""
+        rate = self.rate(host)
+        capacity = self.capacity(host)
+        with closing(self._connect()) as conn:
+            # lock the database for writing, so that the read-modify-write is atomic across processes
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = conn.execute(
+                    "SELECT tokens, updated FROM buckets WHERE host = ?", (host,)
+                ).fetchone()
+                if row is None:
+                    tokens = capacity
+                else:
+                    tokens = min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+                if tokens >= 1:
+                    tokens -= 1
+                    wait = 0.0
+                else:
+                    wait = (1 - tokens) / rate
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (host, tokens, updated) VALUES (?, ?, ?)",
+                    (host, tokens, now),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    async def acquire(self, url: str) -> None:
+        """Wait until a request to the host of `url` is allowed."""
+        host = host_from_url(url)
+        while True:
+            try:
+                wait = await asyncio.to_thread(self.try_acquire, host)
+            except sqlite3.Error as e:
+                # a broken limiter should not fail the requests themselves
+                logger.warning(
+                    f"Rate limiting with {self.path} failed, not limiting the request to {host=}: {e}"
+                )
+                return
+            if wait <= 0:
+                return
+            logger.debug(f"Rate limit for {host=} reached, waiting {wait:.2f}s")
+            await asyncio.sleep(wait)
@@ -3,14 +3,32 @@ import asyncio
 import logging
 import backoff
 
+from .nodes import DEFAULT_SEARCH_NODES, discover_search_nodes
+from .probing import DataNodeProbe, filter_urls_fastest
+from .ratelimit import SharedRateLimiter
+from .scheduling import ProgressLike, iter_bounded, map_bounded
 from .utils import facets_from_iid
-from typing import Dict, List, Tuple, Any, Optional, Union
-
-# import backoff #might still be using the backoff stuff later
-from tqdm.asyncio import tqdm
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Sized,
+    Tuple,
+    Union,
+)
 
 logger = logging.getLogger(__name__)
 
+# importing backoff resets the level of its logger https://github.com/litl/backoff/issues/71
+# so this has to happen after the import.
+logging.getLogger("backoff").setLevel(logging.FATAL)
+# not sure if this is needed, but I want to avoid the many backoff messages
+
 
 ## async steps
 def backoff_hdlr(details):
@@ -33,7 +51,12 @@ async def url_responsive(
     semaphore: asyncio.BoundedSemaphore,
     url: str,
     timeout: int,
+    rate_limiter: Optional[SharedRateLimiter] = None,
 ) -> Union[None, str]:
+    # wait for the token before taking a concurrency slot, so that requests waiting
+    # for a slow host do not block requests to other hosts
+    if rate_limiter is not None:
+        await rate_limiter.acquire(url)
     async with semaphore:
         try:
             async with session.get(url, timeout=timeout) as resp:
@@ -75,7 +98,10 @@ async def get_response_data(
     url: str,
     params: Dict[str, str],
     timeout: int,
-) -> Union[None, str]:
+    rate_limiter: Optional[SharedRateLimiter] = None,
+) -> Union[None, Dict[str, Any]]:
+    if rate_limiter is not None:
+        await rate_limiter.acquire(url)
     async with semaphore:
         try:
             async with session.get(
@@ -101,12 +127,17 @@ async def filter_responsive_urls(
     session: aiohttp.ClientSession,
     semaphore: asyncio.BoundedSemaphore,
     node_list: List[str],
+    rate_limiter: Optional[SharedRateLimiter] = None,
 ) -> List[str]:
     """Filters a list of search nodes for those that are responsive."""
     tasks = []
     for url in node_list:
         tasks.append(
-            asyncio.ensure_future(url_responsive(session, semaphore, url, timeout=10))
+            asyncio.ensure_future(
+                url_responsive(
+                    session, semaphore, url, timeout=10, rate_limiter=rate_limiter
+                )
+            )
         )
 
     unfiltered_urls = await asyncio.gather(*tasks)
@@ -117,6 +148,7 @@ async def get_first_responsive_url(
     session: aiohttp.ClientSession,
     semaphore: asyncio.BoundedSemaphore,
     iid_url_tuple: Tuple[str, List[str]],
+    rate_limiter: Optional[SharedRateLimiter] = None,
 ) -> Union[Tuple[str, str], Tuple[str, None]]:
     """Filters a list of search nodes for those that are responsive."""
     label, url_list = iid_url_tuple
@@ -125,7 +157,9 @@ async def get_first_responsive_url(
         for url in url_list:
             tasks.append(
                 asyncio.ensure_future(
-                    url_responsive(session, semaphore, url, timeout=30)
+                    url_responsive(
+                        session, semaphore, url, timeout=30, rate_limiter=rate_limiter
+                    )
                 )
             )
 
@@ -144,11 +178,17 @@ async def get_urls_for_iid(
     iid: str,
     node_url: str,
     timeout: int,
+    rate_limiter: Optional[SharedRateLimiter] = None,
 ) -> Union[None, Dict[str, List[Dict[str, str]]]]:
     params = esgf_params_from_iid({}, iid)
     logger.debug(f"{iid=} Requesting from {node_url=} {params =}")
     iid_response = await get_response_data(
-        session, semaphore, node_url, params=params, timeout=timeout
+        session,
+        semaphore,
+        node_url,
+        params=params,
+        timeout=timeout,
+        rate_limiter=rate_limiter,
     )
     # check validity of response
     if iid_response is None:
@@ -162,6 +202,118 @@ async def get_urls_for_iid(
         return {iid: iid_response["response"]["docs"]}
 
 
+async def get_number_of_files(
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.BoundedSemaphore,
+    iid: str,
+    node_urls: List[str],
+    timeout: int,
+    rate_limiter: Optional[SharedRateLimiter] = None,
+) -> Optional[int]:
+    """Get the declared number of files of an iid from its Dataset records
+    (`number_of_files` is not part of the File records). Nodes are asked one after
+    another until one returns a Dataset record. Returns None if the replicas disagree
+    or no node knows the dataset."""
+    params = esgf_params_from_iid(
+        {"type": "Dataset", "fields": "instance_id, number_of_files"}, iid
+    )
+    for node_url in node_urls:
+        dataset_response = await get_response_data(
+            session,
+            semaphore,
+            node_url,
+            params=params,
+            timeout=timeout,
+            rate_limiter=rate_limiter,
+        )
+        if dataset_response is None or dataset_response["response"]["numFound"] == 0:
+            continue
+        declared = set()
+        for doc in dataset_response["response"]["docs"]:
+            n = doc.get("number_of_files")
+            n = n[0] if isinstance(n, list) else n
+            declared.add(None if n is None else int(n))
+        if len(declared) == 1 and None not in declared:
+            return declared.pop()
+        logger.debug(f"{iid=}: No unique number of files declared on {node_url=}")
+        return None
+    return None
+
+
+async def get_urls_for_iid_from_nodes(
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.BoundedSemaphore,
+    iid: str,
+    node_urls: List[str],
+    timeout: int,
+    sufficient: bool = False,
+    min_confirming_nodes: int = 1,
+    rate_limiter: Optional[SharedRateLimiter] = None,
+) -> List[Dict[str, List[Dict[str, str]]]]:
+    """Request the files of a single iid from all search nodes.
+    If `sufficient` is True, the declared number of files is requested alongside
+    (see `get_number_of_files`) and outstanding requests are cancelled as soon as the
+    results gathered so far form a complete file set (see `iid_results_sufficient`).
+    """
+    tasks = [
+        asyncio.ensure_future(
+            get_urls_for_iid(
+                session,
+                semaphore,
+                iid,
+                node_url,
+                timeout=timeout,
+                rate_limiter=rate_limiter,
+            )
+        )
+        for node_url in node_urls
+    ]
+    if not sufficient:
+        results = await asyncio.gather(*tasks)
+        return [r for r in results if r is not None]
+
+    number_of_files_task = asyncio.ensure_future(
+        get_number_of_files(
+            session,
+            semaphore,
+            iid,
+            node_urls,
+            timeout=timeout,
+            rate_limiter=rate_limiter,
+        )
+    )
+    iid_results: List[Dict[str, List[Dict[str, str]]]] = []
+    pending: Set[asyncio.Future] = set(tasks) | {number_of_files_task}
+    try:
+        while pending - {number_of_files_task}:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            iid_results.extend(
+                r
+                for r in (t.result() for t in done if t is not number_of_files_task)
+                if r is not None
+            )
+            if (
+                pending - {number_of_files_task}
+                and number_of_files_task.done()
+                and iid_results_sufficient(
+                    iid_results,
+                    min_confirming_nodes,
+                    number_of_files=number_of_files_task.result(),
+                )
+            ):
+                logger.debug(
+                    f"{iid=}: File set complete, cancelling {len(pending)} outstanding requests"
+                )
+                break
+    finally:
+        for p in pending:
+            p.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    return iid_results
+
+
 ## utility processing functions (working on response output)
 def get_http(urls: list[str]) -> str:
     """Filter for http urls"""
@@ -256,6 +408,46 @@ def get_unique_filenames(
     return filename_dict
 
 
+def iid_results_sufficient(
+    iid_results: List[Dict[str, List[Dict[str, Any]]]],
+    min_confirming_nodes: int = 1,
+    number_of_files: Optional[int] = None,
+) -> bool:
+    """Check if the results for a single iid (one entry per search node) are complete.
+
+    This is the case if at least `min_confirming_nodes` nodes returned exactly the declared
+    `number_of_files` (from the Dataset record, see `get_number_of_files`) of unique files,
+    those nodes agree on the filenames, and no other node returned a file outside of that set.
+    If `number_of_files` is not given, all file records have to agree on a declared
+    `number_of_files` instead. Without a declared number the results are never sufficient.
+    """
+    if len(iid_results) < min_confirming_nodes:
+        return False
+    declared: Set[int] = set()
+    filesets = []
+    for result in iid_results:
+        for docs in result.values():
+            if number_of_files is None:
+                for r in docs:
+                    n = r.get("number_of_files")
+                    n = n[0] if isinstance(n, list) else n
+                    if n is None:
+                        return False
+                    declared.add(int(n))
+            filesets.append(frozenset(r["id"].split("|")[0] for r in docs))
+    if number_of_files is None:
+        if len(declared) != 1:
+            return False
+        [number_of_files] = declared
+    complete = [fs for fs in filesets if len(fs) == number_of_files]
+    if len(complete) < min_confirming_nodes or len(set(complete)) != 1:
+        return False
+    # check for files outside the agreed set and for duplicate timesteps (multiple versions)
+    if not all(fs <= complete[0] for fs in filesets):
+        return False
+    return len(set(f.split("_")[-1] for f in complete[0])) == len(complete[0])
+
+
 def esgf_params_from_iid(params: Dict[str, str], iid: str) -> Dict[str, str]:
     """Generates parameters for a GET request to the ESGF API based on the instance id."""
     # set default search parameters
@@ -263,15 +455,13 @@ def esgf_params_from_iid(params: Dict[str, str], iid: str) -> Dict[str, str]:
         "type": "File",
         "retracted": "false",
         "format": "application/solr+json",
-        "fields": "id, url, title, latest, replica, data_node",
+        "fields": "id, url, title, latest, replica, data_node, number_of_files",
         "distrib": "true",
         "limit": "500",  # This determines the number of urls/files that are returned. I dont expect this to be ever more than 500?
     }
     params = default_params | params
+    # `v` is removed from version by `facets_from_iid`
     facets = facets_from_iid(iid)
-    # `v` has to be removed from version
-    if "version" in facets:
-        facets["version"] = facets["version"].replace("v", "")
 
     # combine params and facets
     params = params | facets
@@ -301,44 +491,126 @@ async def filter_urls_first_responsive(
     session: aiohttp.ClientSession,
     semaphore: asyncio.BoundedSemaphore,
     iid_url_tuple_list: List[Tuple[str, List[str]]],
+    n_workers: int = 50,
+    progress: ProgressLike = "tqdm",
+    rate_limiter: Optional[SharedRateLimiter] = None,
 ) -> List[Tuple[str, List[str]]]:
-    tasks = []
-    for iid_url_tuple in iid_url_tuple_list:
-        tasks.append(
-            asyncio.ensure_future(
-                get_first_responsive_url(session, semaphore, iid_url_tuple)
-            )
+    async def first_responsive(iid_url_tuple):
+        return await get_first_responsive_url(
+            session, semaphore, iid_url_tuple, rate_limiter=rate_limiter
         )
-    results = await tqdm.gather(
-        *tasks,
-        position=0,
-        leave=True,  # https://stackoverflow.com/questions/41707229/why-is-tqdm-printing-to-a-newline-instead-of-updating-the-same-line
-        miniters=int(
-            len(tasks) / 10
-        ),  # https://stackoverflow.com/questions/47995958/python-tqdm-package-how-to-configure-for-less-frequent-status-bar-updates
-        maxinterval=float("inf"),
+
+    results = await map_bounded(
+        first_responsive,
+        iid_url_tuple_list,
+        n_workers=n_workers,
+        progress=progress,
+        desc="Checking url responsiveness",
+        total=len(iid_url_tuple_list),
     )
     filtered_results = [r for r in results if r[1] is not None]
     return filtered_results
 
 
-async def get_urls_from_esgf(
-    iids: List[str],
+def group_iid_results(
+    iid_results: List[Dict[str, List[Dict[str, Any]]]],
+) -> List[Tuple[str, List[str]]]:
+    """Convert a flat list of results to a list of ('iid|filename', [unique_urls])"""
+    keyed_results = [
+        (flatten_iid_filename(iid, r), get_http(r["url"]))
+        for r_dict in iid_results
+        for iid, r_list in r_dict.items()
+        for r in r_list
+    ]
+    # aggregate urls of results per iid and filename
+    group_dict: Dict[str, List[str]] = {}
+    for r in keyed_results:
+        if r[0] not in group_dict:
+            group_dict[r[0]] = []
+        group_dict[r[0]].append(r[1])
+    return [(k, list(set(v))) for k, v in group_dict.items()]
+
+
+choose_url_options = ["preferred", "first", "first_responsive", "fastest"]
+
+
+async def choose_urls(
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.BoundedSemaphore,
+    iid_results_grouped: List[Tuple[str, List[str]]],
+    choose_url: str = "first",
+    n_workers: int = 50,
+    data_node_probe: Optional[DataNodeProbe] = None,
+    rate_limiter: Optional[SharedRateLimiter] = None,
+) -> List[Tuple[str, Any]]:
+    """Choose one url per file"""
+    if choose_url == "preferred":
+        raise NotImplementedError("Preferred data node filtering not implemented yet")
+        logger.debug("Find preferred data node url for each file")
+        return filter_urls_preferred_node(iid_results_grouped, preferred_data_nodes)
+    elif choose_url == "first":
+        logger.debug("Find first url for each file")
+        return filter_urls_first(iid_results_grouped)
+    elif choose_url == "first_responsive":
+        logger.debug("Find first responsive url for each file")
+        return await filter_urls_first_responsive(
+            session,
+            semaphore,
+            iid_results_grouped,
+            n_workers=n_workers,
+            progress=None,
+            rate_limiter=rate_limiter,
+        )
+    elif choose_url == "fastest":
+        logger.debug("Find url on the fastest data node for each file")
+        if data_node_probe is None:
+            data_node_probe = DataNodeProbe()
+        await data_node_probe.probe(
+            session, semaphore, iid_results_grouped, rate_limiter=rate_limiter
+        )
+        return filter_urls_fastest(iid_results_grouped, data_node_probe)
+    else:
+        raise ValueError(
+            f"Unknown value for {choose_url=}. Must be one of {choose_url_options}"
+        )
+
+
+async def iter_urls_from_esgf(
+    iids: Union[Iterable[str], AsyncIterable[str]],
     limit_per_host: int = 50,
     max_concurrency: int = 50,
     max_concurrency_response: int = 50,
     search_nodes: Optional[List[str]] = None,
     choose_url: str = "first",
-):
-    if search_nodes is None:
-        search_nodes = [
-            "http://esgf-node.llnl.gov/esg-search/search",
-            "http://esgf-data.dkrz.de/esg-search/search",
-            "http://esgf-node.ipsl.upmc.fr/esg-search/search",
-            "http://esgf-index1.ceda.ac.uk/esg-search/search",
-            "http://esg-dn1.nsc.liu.se/esg-search/search",
-            "http://esgf.nci.org.au/esg-search/search",
-        ]
+    sufficient: bool = False,
+    min_confirming_nodes: int = 1,
+    progress: ProgressLike = "tqdm",
+    search_node_registry: Optional[str] = None,
+    search_node_cache_file: Optional[str] = None,
+    data_node_probe: Optional[DataNodeProbe] = None,
+    rate_limiter: Optional[SharedRateLimiter] = None,
+) -> AsyncIterator[Tuple[str, Optional[List[str]]]]:
+    """Resolve iids one by one and yield `(iid, urls)` as soon as each iid is complete
+    (in order of completion). `urls` is None if no complete url list could be constructed.
+    `iids` can be a lazy (or async) iterable. See `get_urls_from_esgf` for the other arguments.
+    """
+    if choose_url not in choose_url_options:
+        raise ValueError(
+            f"Unknown value for {choose_url=}. Must be one of {choose_url_options}"
+        )
+    for name, value in [
+        ("max_concurrency", max_concurrency),
+        ("max_concurrency_response", max_concurrency_response),
+    ]:
+        if value < 1:
+            raise ValueError(f"{name}={value} must be at least 1")
+    if choose_url == "fastest" and data_node_probe is None:
+        # shared between all iids, so that each data node is only probed once
+        data_node_probe = DataNodeProbe()
+    if choose_url == "first_responsive":
+        logger.warn(
+            "This method seems to be unreliable for getting many urls. \nIf you are getting less datasets than you expect, try 'first' instead."
+        )
 
     semaphore = asyncio.BoundedSemaphore(
         max_concurrency
@@ -346,117 +618,147 @@ async def get_urls_from_esgf(
     semaphore_responsive = asyncio.BoundedSemaphore(max_concurrency_response)
     connector = aiohttp.TCPConnector(limit_per_host=limit_per_host)
     async with aiohttp.ClientSession(connector=connector) as session:
-        logger.info(f"Checking responsiveness of {search_nodes=}")
-        responsive_search_nodes = await filter_responsive_urls(
-            session, semaphore_responsive, search_nodes
-        )
+        if search_nodes is None:
+            responsive_search_nodes = await discover_search_nodes(
+                registry=search_node_registry,
+                session=session,
+                cache_file=search_node_cache_file,
+            )
+        else:
+            logger.info(f"Checking responsiveness of {search_nodes=}")
+            responsive_search_nodes = await filter_responsive_urls(
+                session, semaphore_responsive, search_nodes, rate_limiter=rate_limiter
+            )
         if len(responsive_search_nodes) == 0:
-            raise RuntimeError(f"None of the {search_nodes=} are responsive")
+            if search_nodes is not None:
+                candidates = f"{search_nodes}"
+            elif search_node_registry is not None:
+                candidates = f"registry {search_node_registry}"
+            else:
+                candidates = f"{DEFAULT_SEARCH_NODES}"
+            raise RuntimeError(f"None of the search nodes {candidates} are responsive")
         logger.info(f"{responsive_search_nodes=}")
 
         # We are now basically making requests to all search nodes fore each iid. This will return
         # results on a *file* basis. While this is rather redundant, I have seen cases where there are
         # inconsistencies between search nodes, and I just want to make super sure that we get every single
         # file/url combo that might be available. To speed this up, just trim the list of search nodes!
+        # Each iid is processed as soon as all its requests are done.
+        missing_iids = []
+
+        async def resolve_iid(iid: str) -> Tuple[str, Optional[List[str]]]:
+            iid_results = await get_urls_for_iid_from_nodes(
+                session,
+                semaphore,
+                iid,
+                responsive_search_nodes,
+                timeout=10,
+                sufficient=sufficient,
+                min_confirming_nodes=min_confirming_nodes,
+                rate_limiter=rate_limiter,
+            )
+            logger.debug(f"{iid_results =} ")
+            if len(iid_results) == 0:
+                missing_iids.append(iid)
+                return iid, None
+
+            # TODO: Check if the versions submitted were latest. If not, suggest for the user to run the query again.
+            try:
+                expected_files = get_unique_filenames(iid_results)
+                iid_results_grouped = group_iid_results(iid_results)
+            except ValueError as e:
+                # e.g. duplicate timesteps, this should not abort the other iids
+                logger.warning(f"{iid=}: Could not process results: {e}")
+                return iid, None
+            filtered_urls_per_file = await choose_urls(
+                session,
+                semaphore_responsive,
+                iid_results_grouped,
+                choose_url=choose_url,
+                n_workers=max_concurrency_response,
+                data_node_probe=data_node_probe,
+                rate_limiter=rate_limiter,
+            )
+            url_dict = url_result_processing(filtered_urls_per_file, expected_files)
+            return iid, url_dict.get(iid)
 
+        # iids are pulled by a fixed pool of workers, so that we never hold more
+        # than `max_concurrency` iid coroutines at once
         logger.info("Requesting urls")
-        logger.debug(f"for {iids=}")
-        tasks = []
-        for iid in iids:
-            for search_node in responsive_search_nodes:
-                tasks.append(
-                    asyncio.ensure_future(
-                        get_urls_for_iid(
-                            session, semaphore, iid, search_node, timeout=10
-                        )
-                    )
-                )
-
-        # trying with a progressbar
-        iid_results = await tqdm.gather(
-            *tasks,
-            position=0,
-            leave=True,  # https://stackoverflow.com/questions/41707229/why-is-tqdm-printing-to-a-newline-instead-of-updating-the-same-line
-            miniters=int(
-                len(tasks) / 10
-            ),  # https://stackoverflow.com/questions/47995958/python-tqdm-package-how-to-configure-for-less-frequent-status-bar-updates
-            maxinterval=float("inf"),
+        async for _, result in iter_bounded(
+            resolve_iid,
+            iids,
+            n_workers=max_concurrency,
+            progress=progress,
+            desc="Requesting urls",
+            total=len(iids) if isinstance(iids, Sized) else None,
+        ):
+            yield result
+
+    # Status message about which iids were not even found on any of the search nodes.
+    if len(missing_iids) > 0:
+        logger.warn(
+            f"Not able to find results for the following {len(missing_iids)} iids: {missing_iids}"
         )
-        logger.info("Processing responses")
-
-        # filter out None values
-        iid_results_filtered = [result for result in iid_results if result is not None]
-        logger.debug(f"{iid_results_filtered =} ")
-
-        # TODO: Check if the versions submitted were latest. If not, suggest for the user to run the query again.
-
-        logger.info("Processing responses: Expected files per iid")
-        # split out the expected number of files per iid
-        expected_files_per_iid = get_unique_filenames(iid_results_filtered)
-        logger.debug(f"{expected_files_per_iid =}")
-
-        logger.info("Processing responses: Check for missing iids")
-        # Status message about which iids were not even found on any of the search nodes.
-        remaining_iids = [
-            iid
-            for iid in iids
-            if iid in [list(r.keys())[0] for r in iid_results_filtered]
-        ]
-        missing_iids = list(set(iids) - set(remaining_iids))
-        if len(missing_iids) > 0:
-            logger.warn(
-                f"Not able to find results for the following {len(missing_iids)} iids: {missing_iids}"
-            )
 
-        # convert flat list of results to dictionary(iid: dict(filename:[unique_urls]))
-        logger.info("Processing responses: Flatten results")
-        keyed_results = [
-            (flatten_iid_filename(iid, r), get_http(r["url"]))
-            for r_dict in iid_results_filtered
-            for iid, r_list in r_dict.items()
-            for r in r_list
-        ]
-        logger.debug(f"{keyed_results =} ")
-
-        logger.info("Processing responses: Group results")
-        # aggregate urls of results per iid and filename
-        group_dict: Dict[str, List[str]] = {}
-        for r in keyed_results:
-            if r[0] not in group_dict:
-                group_dict[r[0]] = []
-            group_dict[r[0]].append(r[1])
-
-        iid_results_grouped = [(k, list(set(v))) for k, v in group_dict.items()]
-        logger.debug(f"{iid_results_grouped =} ")
-        logger.info("Choosing one url per file")
-        if choose_url == "preferred":
-            raise NotImplementedError(
-                "Preferred data node filtering not implemented yet"
-            )
-            logger.info("Find preferred data node url for each file")
-            filtered_urls_per_file = filter_urls_preferred_node(
-                iid_results_grouped, preferred_data_nodes
-            )
-        elif choose_url == "first":
-            logger.info("Find first url for each file")
-            filtered_urls_per_file = filter_urls_first(iid_results_grouped)
-        elif choose_url == "first_responsive":
-            logger.warn(
-                "This method seems to be unreliable for getting many urls. \nIf you are getting less datasets than you expect, try 'first' instead."
-            )
-            logger.info("Find first responsive url for each file")
-            filtered_urls_per_file = await filter_urls_first_responsive(
-                session, semaphore_responsive, iid_results_grouped
-            )
-            logger.debug(f"{filtered_urls_per_file =} ")
-        else:
-            raise ValueError(
-                f"Unknown value for {choose_url=}. Must be one of ['preferred', 'first', 'first_responsive']"
-            )
 
-    final_url_dict = url_result_processing(
-        filtered_urls_per_file, expected_files_per_iid
-    )
+async def get_urls_from_esgf(
+    iids: List[str],
+    limit_per_host: int = 50,
+    max_concurrency: int = 50,
+    max_concurrency_response: int = 50,
+    search_nodes: Optional[List[str]] = None,
+    choose_url: str = "first",
+    sufficient: bool = False,
+    min_confirming_nodes: int = 1,
+    progress: ProgressLike = "tqdm",
+    search_node_registry: Optional[str] = None,
+    search_node_cache_file: Optional[str] = None,
+    data_node_probe: Optional[DataNodeProbe] = None,
+    rate_limiter: Optional[SharedRateLimiter] = None,
+) -> Dict[str, List[str]]:
+    """Get a dictionary of (time sorted) urls for each iid.
+
+    If no `search_nodes` are given, responsive nodes are discovered (and cached) with
+    `pangeo_forge_esgf.nodes.discover_search_nodes`, optionally from a `search_node_registry`.
+
+    By default every responsive search node is asked about every iid. With
+    `sufficient=True`, outstanding requests for an iid are cancelled as soon as
+    `min_confirming_nodes` nodes returned the same complete file set.
+
+    `progress` can be `"tqdm"`, `"logging"`, `None`, a callback `(desc, completed, total)`
+    or a progress sink from `pangeo_forge_esgf.scheduling`.
+
+    With `choose_url="fastest"` a small byte range is downloaded from one file per data node
+    host and the url on the host with the highest throughput is chosen for each file. Pass a
+    `pangeo_forge_esgf.probing.DataNodeProbe` to configure the probe or reuse its scores.
+
+    Pass a `pangeo_forge_esgf.ratelimit.SharedRateLimiter` to limit the request rate per
+    host for the search requests, the responsiveness checks of given `search_nodes` and
+    data urls, and the data node probes of `choose_url="fastest"`. The (cached) automatic
+    discovery of search nodes is not limited. The budget is shared with all other processes
+    on the machine that use the same limiter file, e.g. several feedstock builds running in parallel.
+
+    Use `iter_urls_from_esgf` to process the results while iids are still being resolved.
+    """
+    final_url_dict = {}
+    async for iid, urls in iter_urls_from_esgf(
+        iids,
+        limit_per_host=limit_per_host,
+        max_concurrency=max_concurrency,
+        max_concurrency_response=max_concurrency_response,
+        search_nodes=search_nodes,
+        choose_url=choose_url,
+        sufficient=sufficient,
+        min_confirming_nodes=min_confirming_nodes,
+        progress=progress,
+        search_node_registry=search_node_registry,
+        search_node_cache_file=search_node_cache_file,
+        data_node_probe=data_node_probe,
+        rate_limiter=rate_limiter,
+    ):
+        if urls is not None:
+            final_url_dict[iid] = urls
 
     missing_iids = list(set(iids) - set(final_url_dict.keys()))
     if len(missing_iids) > 0:
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import queue
+import threading
+from functools import partial
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Tuple
+
+from .recipe_inputs import iter_urls_from_esgf
+from .utils import facets_from_iid
+
+logger = logging.getLogger(__name__)
+
+
+def time_range_from_filename(filename: str) -> str:
+    """Get the time range (e.g. `185001-201412`) from a filename following the CMIP naming conventions.
+    For files without a time range (e.g. fixed fields) this returns the last part of the filename.
+    """
+    return filename.split("/")[-1].rsplit(".", 1)[0].split("_")[-1]
+
+
+def variable_from_iid(iid: str, urls: List[str]) -> str:
+    """Get the variable from the facets of `iid`, or (e.g. for CMIP5) from the first filename"""
+    facets = facets_from_iid(iid)
+    for name in ["variable_id", "variable"]:
+        if name in facets:
+            return facets[name]
+    return urls[0].split("/")[-1].split("_")[0]
+
+
+def _url_from_keys(url_map: Dict[str, str], variable: str, time: str) -> str:
+    return url_map[time]
+
+
+def recipe_input_from_urls(iid: str, urls: List[str], **pattern_kwargs: Any):
+    """Build a pangeo-forge `FilePattern` for a single iid. The time ranges in the filenames are
+    used as keys of the `time` concat dim, and the variable of the iid as key of the `variable` merge dim.
+    Additional keyword arguments are passed to `FilePattern`.
+    """
+    try:
+        from pangeo_forge_recipes.patterns import ConcatDim, FilePattern, MergeDim
+    except ImportError:
+        raise ImportError(
+            "Building recipe inputs requires `pangeo-forge-recipes`. "
+            "Install it with `pip install pangeo-forge-esgf[recipes]`"
+        )
+    url_map = {time_range_from_filename(url): url for url in urls}
+    if len(url_map) != len(urls):
+        raise ValueError(f"Found duplicate time ranges for {iid=} in {urls=}")
+    return FilePattern(
+        partial(_url_from_keys, url_map),
+        MergeDim("variable", [variable_from_iid(iid, urls)]),
+        ConcatDim("time", list(url_map.keys())),
+        **pattern_kwargs,
+    )
+
+
+async def iter_recipe_inputs(
+    iids: Iterable[str], **kwargs: Any
+) -> AsyncIterator[Tuple[str, Any]]:
+    """Yield `(iid, FilePattern)` as soon as each iid is resolved.
+    Keyword arguments are passed to `iter_urls_from_esgf`.
+    """
+    async for iid, urls in iter_urls_from_esgf(iids, **kwargs):
+        if urls is None:
+            logger.debug(f"Skipping {iid=} because no complete url list was found")
+            continue
+        yield iid, recipe_input_from_urls(iid, urls)
+
+
+_done = object()
+
+
+def recipe_inputs_from_iids(
+    iids: Iterable[str], maxsize: int = 100, **kwargs: Any
+) -> Iterator[Tuple[str, Any]]:
+    """Synchronous version of `iter_recipe_inputs`. The iids are resolved in a background
+    thread, so that e.g. a Beam pipeline can be constructed from the first results while the
+    remaining iids are still being resolved.
+
+    At most `maxsize` results are buffered, resolution pauses while the buffer is full.
+    Resolution stops when the consumer stops iterating (e.g. breaks out of the loop).
+    """
+    results: queue.Queue = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        """Put `item` in the queue, unless the consumer stopped. Returns False if stopped."""
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    async def produce():
+        items = iter_recipe_inputs(iids, **kwargs)
+        try:
+            async for item in items:
+                # wait for free space without blocking the event loop
+                while results.full() and not stop.is_set():
+                    await asyncio.sleep(0.05)
+                if not put(item):
+                    logger.debug("Consumer stopped, not resolving the remaining iids")
+                    return
+        finally:
+            await items.aclose()
+
+    def run():
+        try:
+            asyncio.run(produce())
+        except BaseException as e:
+            put(e)
+        else:
+            put(_done)
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        while True:
+            item = results.get()
+            if item is _done:
+                return
+            elif isinstance(item, Exception):
+                raise item
+            elif isinstance(item, BaseException):
+                raise RuntimeError("Resolving iids was aborted") from item
+            yield item
+    finally:
+        stop.set()
+
+
+async def generate_recipe_inputs_from_iids(
+    iids: Iterable[str], **kwargs: Any
+) -> Dict[str, Any]:
+    """Get a dictionary of `FilePattern` objects for each iid.
+    Keyword arguments are passed to `iter_urls_from_esgf`.
+    """
+    return {iid: pattern async for iid, pattern in iter_recipe_inputs(iids, **kwargs)}
@@ -0,0 +1,256 @@
+import asyncio
+import itertools
+import logging
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+## progress sinks
+class NullProgress:
+    """Progress sink that does not report anything."""
+
+    def start(self, desc: Optional[str] = None, total: Optional[int] = None) -> None:
+        pass
+
+    def update(self, n: int = 1) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class TqdmProgress(NullProgress):
+    """Report progress with a tqdm progressbar. Keyword arguments are passed to `tqdm`."""
+
+    def __init__(self, **tqdm_kwargs):
+        self.tqdm_kwargs = tqdm_kwargs
+        self.pbar = None
+
+    def start(self, desc: Optional[str] = None, total: Optional[int] = None) -> None:
+        from tqdm import tqdm
+
+        kwargs = dict(
+            position=0,
+            leave=True,  # https://stackoverflow.com/questions/41707229/why-is-tqdm-printing-to-a-newline-instead-of-updating-the-same-line
+            maxinterval=float("inf"),
+        )
+        if total is not None:
+            # https://stackoverflow.com/questions/47995958/python-tqdm-package-how-to-configure-for-less-frequent-status-bar-updates
+            kwargs["miniters"] = int(total / 10)
+        kwargs.update(self.tqdm_kwargs)
+        self.pbar = tqdm(desc=desc, total=total, **kwargs)
+
+    def update(self, n: int = 1) -> None:
+        self.pbar.update(n)
+
+    def close(self) -> None:
+        if self.pbar is not None:
+            self.pbar.close()
+            self.pbar = None
+
+
+class LoggingProgress(NullProgress):
+    """Report progress as log messages, roughly every `fraction` of the total
+    (or every `every` completed requests if the total is unknown)."""
+
+    def __init__(
+        self,
+        logger: logging.Logger = logger,
+        level: int = logging.INFO,
+        fraction: float = 0.1,
+        every: int = 1000,
+    ):
+        self.logger = logger
+        self.level = level
+        self.fraction = fraction
+        self.every = every
+
+    def start(self, desc: Optional[str] = None, total: Optional[int] = None) -> None:
+        self.desc = desc or "Progress"
+        self.total = total
+        self.completed = 0
+        if total:
+            self.interval = max(1, int(total * self.fraction))
+        else:
+            self.interval = self.every
+
+    def update(self, n: int = 1) -> None:
+        before = self.completed
+        self.completed += n
+        if self.completed // self.interval != before // self.interval:
+            self._log()
+
+    def close(self) -> None:
+        if self.completed % self.interval != 0:
+            self._log()
+
+    def _log(self) -> None:
+        total = "?" if self.total is None else self.total
+        self.logger.log(self.level, f"{self.desc}: {self.completed}/{total}")
+
+
+class CallbackProgress(NullProgress):
+    """Call `callback(desc, completed, total)` after each completed request."""
+
+    def __init__(self, callback: Callable[[Optional[str], int, Optional[int]], Any]):
+        self.callback = callback
+
+    def start(self, desc: Optional[str] = None, total: Optional[int] = None) -> None:
+        self.desc = desc
+        self.total = total
+        self.completed = 0
+
+    def update(self, n: int = 1) -> None:
+        self.completed += n
+        self.callback(self.desc, self.completed, self.total)
+
+
+ProgressLike = Union[None, bool, str, NullProgress, Callable]
+
+
+def get_progress_sink(progress: ProgressLike) -> NullProgress:
+    """Translate the `progress` argument of the public functions into a progress sink.
+    Accepts `None`/`False`, `"tqdm"`, `"logging"`, a progress sink instance or a callback.
+    """
+    if progress is None or progress is False:
+        return NullProgress()
+    elif isinstance(progress, NullProgress):
+        return progress
+    elif progress is True or progress == "tqdm":
+        return TqdmProgress()
+    elif progress == "logging":
+        return LoggingProgress()
+    elif callable(progress):
+        return CallbackProgress(progress)
+    else:
+        raise ValueError(
+            f"Unknown value for {progress=}. Must be one of [None, 'tqdm', 'logging'], a progress sink or a callable"
+        )
+
+
+## bounded scheduling
+_finished = object()
+_failed = object()
+
+
+_exhausted = object()
+
+
+def _item_getter(
+    items: Union[Iterable[T], AsyncIterable[T]],
+) -> Callable[[], Awaitable[Any]]:
+    """Returns a coroutine function that gets the next `(index, item)`, and can be shared
+    between workers. Returns `_exhausted` once there are no items left."""
+    counter = itertools.count()
+    if isinstance(items, AsyncIterable):
+        async_iterator = items.__aiter__()
+        lock = asyncio.Lock()
+
+        async def next_async_item():
+            # async generators can not be advanced by several workers at once
+            async with lock:
+                try:
+                    item = await async_iterator.__anext__()
+                except StopAsyncIteration:
+                    return _exhausted
+                return next(counter), item
+
+        return next_async_item
+
+    iterator = iter(items)
+
+    async def next_item():
+        for item in iterator:
+            return next(counter), item
+        return _exhausted
+
+    return next_item
+
+
+async def iter_bounded(
+    func: Callable[[T], Awaitable[R]],
+    items: Union[Iterable[T], AsyncIterable[T]],
+    n_workers: int,
+    progress: ProgressLike = None,
+    desc: Optional[str] = None,
+    total: Optional[int] = None,
+) -> AsyncIterator[Tuple[int, R]]:
+    """Apply `func` to `items` with a fixed pool of `n_workers` workers pulling from
+    the (possibly lazy) iterator of items, and yield `(index, result)` in order of completion.
+    `items` can also be an async iterable, e.g. to feed in items while they are being produced.
+
+    Only `n_workers` coroutines exist at any time, so memory stays flat regardless of
+    the number of items.
+    """
+    if n_workers < 1:
+        raise ValueError(f"{n_workers=} must be at least 1")
+    sink = get_progress_sink(progress)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=n_workers)
+    next_item = _item_getter(items)
+
+    async def worker():
+        try:
+            while True:
+                next_index_item = await next_item()
+                if next_index_item is _exhausted:
+                    break
+                index, item = next_index_item
+                result = await func(item)
+                await queue.put((index, result))
+        except Exception as e:
+            await queue.put((_failed, e))
+        else:
+            await queue.put((_finished, None))
+
+    sink.start(desc=desc, total=total)
+    workers = [asyncio.ensure_future(worker()) for _ in range(n_workers)]
+    try:
+        finished = 0
+        while finished < len(workers):
+            index, result = await queue.get()
+            if index is _finished:
+                finished += 1
+            elif index is _failed:
+                raise result
+            else:
+                sink.update(1)
+                yield index, result
+    finally:
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        sink.close()
+
+
+async def map_bounded(
+    func: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    n_workers: int,
+    progress: ProgressLike = None,
+    desc: Optional[str] = None,
+    total: Optional[int] = None,
+) -> List[R]:
+    """Like `iter_bounded`, but collects the results in the order of `items`."""
+    results: Dict[int, R] = {}
+    async for index, result in iter_bounded(
+        func, items, n_workers, progress=progress, desc=desc, total=total
+    ):
+        results[index] = result
+    return [results[i] for i in range(len(results))]
@@ -0,0 +1,30 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable
+
+import pytest
+from aiohttp import web
+
+
+@asynccontextmanager
+async def serve(
+    route: str, handler: Callable[..., Awaitable], host: str = "127.0.0.1"
+) -> AsyncIterator[str]:
+    """Run a local aiohttp server answering GET requests to `route` on a free port,
+    and yield its base url (e.g. `http://127.0.0.1:12345`)."""
+    app = web.Application()
+    app.router.add_get(route, handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, host, 0)
+        await site.start()
+        yield f"http://{host}:{runner.addresses[0][1]}"
+    finally:
+        await runner.cleanup()
+
+
+@pytest.fixture
+def local_server():
+    """Local stand-in for search or data nodes, used as
+    `async with local_server("/search", handler) as base_url: ...`"""
+    return serve
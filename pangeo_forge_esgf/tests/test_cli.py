@@ -0,0 +1,171 @@
+import json
+import pytest
+
+from pangeo_forge_esgf import cli, nodes, parsing, recipe_inputs
+from pangeo_forge_esgf.cli import is_pattern, main, read_iids
+
+
+@pytest.mark.parametrize(
+    "iid, expected",
+    [
+        ("CMIP6.PMIP.*.*.lgm.*.*.uo.*.*", True),
+        ("CMIP6.PMIP.AWI.AWI-ESM-1-1-LR.lgm.r1i1p1f1.Omon.[uo, vo].gn.v20200212", True),
+        ("CMIP6.PMIP.AWI.AWI-ESM-1-1-LR.lgm.r1i1p1f1.Omon.uo.gn.v20200212", False),
+    ],
+)
+def test_is_pattern(iid, expected):
+    assert is_pattern(iid) == expected
+
+
+def test_read_iids():
+    lines = ["# some comment\n", "a.b.c  # trailing comment\n", "\n", "  d.e.f\n"]
+    assert read_iids(lines) == ["a.b.c", "d.e.f"]
+
+
+@pytest.fixture
+def mock_esgf(monkeypatch):
+    seen = []
+
+    def mock_parse_instance_ids(pattern, **kwargs):
+        if pattern.startswith("nothing"):
+            return []
+        return ["parsed.iid.1", "plain.iid"]
+
+    async def mock_iter_urls_from_esgf(iids, **kwargs):
+        seen.append(kwargs)
+        async for iid in iids:
+            yield iid, None if iid == "parsed.iid.1" else [f"http://{iid}.nc"]
+
+    monkeypatch.setattr(parsing, "parse_instance_ids", mock_parse_instance_ids)
+    monkeypatch.setattr(recipe_inputs, "iter_urls_from_esgf", mock_iter_urls_from_esgf)
+    return seen
+
+
+def test_main(mock_esgf, tmp_path, capsys):
+    input_file = tmp_path / "iids.txt"
+    input_file.write_text("plain.iid\nsome.*.pattern\nnothing.*.found\n")
+    output_file = tmp_path / "urls.jsonl"
+    exit_code = main(
+        [
+            str(input_file),
+            "-o",
+            str(output_file),
+            "--search-node",
+            "http://node/search",
+            "--sufficient",
+        ]
+    )
+    results = [json.loads(line) for line in output_file.read_text().splitlines()]
+    assert results == [
+        {"iid": "plain.iid", "urls": ["http://plain.iid.nc"]},
+        {"iid": "parsed.iid.1", "urls": None},
+    ]
+    assert mock_esgf[0]["search_nodes"] == ["http://node/search"]
+    assert mock_esgf[0]["sufficient"]
+    assert mock_esgf[0]["progress"] is None
+    assert mock_esgf[0]["rate_limiter"] is None
+    assert exit_code == 1
+    summary = capsys.readouterr().err
+    assert "Resolved 1/2 iids" in summary
+    assert "No iids found for pattern: nothing.*.found" in summary
+    assert "Failed to resolve: parsed.iid.1" in summary
+
+
+def test_main_stdin(mock_esgf, monkeypatch, capsys):
+    monkeypatch.setattr(cli.sys, "stdin", ["plain.iid\n"])
+    assert main([]) == 0
+    out = capsys.readouterr().out
+    assert json.loads(out) == {"iid": "plain.iid", "urls": ["http://plain.iid.nc"]}
+
+
+def test_main_failing_node_keeps_stdout_valid(monkeypatch, capsys):
+    class Response:
+        def __init__(self, url, status_code, docs):
+            self.url = url
+            self.status_code = status_code
+            self._json = {"response": {"docs": docs, "numFound": len(docs)}}
+
+        def json(self):
+            return self._json
+
+    def mock_request_from_facets(url, **facets):
+        if url == "http://broken/search":
+            return Response(f"{url}?x", 500, [])
+        iid = "CMIP6.PMIP.AWI.AWI-ESM-1-1-LR.lgm.r1i1p1f1.Omon.uo.gn.v20200212"
+        return Response(url, 200, [{"instance_id": iid}])
+
+    async def mock_iter_urls_from_esgf(iids, **kwargs):
+        async for iid in iids:
+            yield iid, [f"http://{iid}.nc"]
+
+    monkeypatch.setattr(parsing, "request_from_facets", mock_request_from_facets)
+    monkeypatch.setattr(recipe_inputs, "iter_urls_from_esgf", mock_iter_urls_from_esgf)
+    monkeypatch.setattr(cli.sys, "stdin", ["CMIP6.PMIP.*.*.lgm.*.*.uo.*.*\n"])
+    argv = [
+        "--search-node",
+        "http://broken/search",
+        "--search-node",
+        "http://ok/search",
+    ]
+    assert main(argv) == 0
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 1
+    assert [json.loads(line)["iid"] for line in lines] == [
+        "CMIP6.PMIP.AWI.AWI-ESM-1-1-LR.lgm.r1i1p1f1.Omon.uo.gn.v20200212"
+    ]
+
+
+def test_main_rate_limit(mock_esgf, monkeypatch, tmp_path):
+    monkeypatch.setattr(cli.sys, "stdin", ["plain.iid\n"])
+    db = tmp_path / "ratelimit.sqlite"
+    argv = ["--rate-limit-db", str(db), "--rate-limit", "https://node:8080/search=2.5"]
+    assert main(argv) == 0
+    rate_limiter = mock_esgf[0]["rate_limiter"]
+    assert rate_limiter.path == str(db)
+    assert rate_limiter.rate("node:8080") == 2.5
+    assert rate_limiter.rate("other") == 10
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["--rate-limit", "node"],
+        ["--rate-limit", "node=0"],
+        ["--rate-limit", "node=-1"],
+        ["--default-rate", "0"],
+    ],
+)
+def test_main_invalid_rate_limit(capsys, argv):
+    with pytest.raises(SystemExit):
+        main(argv)
+    assert "argument --" in capsys.readouterr().err
+
+
+def test_main_invalid_choose_url(capsys):
+    with pytest.raises(SystemExit):
+        main(["--choose-url", "preferred"])
+
+
+def test_main_no_responsive_nodes(monkeypatch, capsys):
+    async def mock_iter_urls_from_esgf(iids, **kwargs):
+        raise RuntimeError("None of the search nodes are responsive")
+        yield
+
+    monkeypatch.setattr(recipe_inputs, "iter_urls_from_esgf", mock_iter_urls_from_esgf)
+    monkeypatch.setattr(cli.sys, "stdin", ["plain.iid\n"])
+    assert main([]) == 2
+    assert "None of the search nodes are responsive" in capsys.readouterr().err
+
+
+def test_main_no_responsive_nodes_while_parsing(monkeypatch, capsys):
+    async def mock_iter_urls_from_esgf(iids, **kwargs):
+        async for iid in iids:
+            yield iid, [f"http://{iid}.nc"]
+
+    monkeypatch.setattr(nodes, "get_search_nodes", lambda **kwargs: [])
+    monkeypatch.setattr(recipe_inputs, "iter_urls_from_esgf", mock_iter_urls_from_esgf)
+    monkeypatch.setattr(cli.sys, "stdin", ["CMIP6.PMIP.*.*.lgm.*.*.uo.*.*\n"])
+    assert main([]) == 2
+    err = capsys.readouterr().err
+    assert "are responsive" in err
+    assert "No iids found for pattern" not in err
@@ -0,0 +1,79 @@
+"""Guard the import time of the package. Heavy dependencies should only be loaded on first use."""
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+heavy_modules = ["aiohttp", "requests", "tqdm", "backoff"]
+
+
+def run_python(code: str, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def cumulative_import_time(module: str) -> int:
+    """Cumulative import time of `module` in microseconds, measured in a fresh interpreter"""
+    stderr = run_python(f"import {module}", "-X", "importtime").stderr
+    # lines look like `import time:  self [us] | cumulative | imported package`
+    for line in reversed(stderr.splitlines()):
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1])
+    raise ValueError(f"Could not find import time of {module=}")
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "pangeo_forge_esgf",
+        "pangeo_forge_esgf.utils",
+        "pangeo_forge_esgf.parsing",
+        "pangeo_forge_esgf.cli",
+    ],
+)
+def test_no_heavy_imports(module):
+    code = (
+        "import json, sys\n"
+        f"import {module}\n"
+        f"print(json.dumps([m for m in {heavy_modules} if m in sys.modules]))"
+    )
+    assert json.loads(run_python(code).stdout) == []
+
+
+def test_public_names_load_on_first_use():
+    code = (
+        "import json, sys\n"
+        "import pangeo_forge_esgf\n"
+        "from pangeo_forge_esgf import get_urls_from_esgf, generate_recipe_inputs_from_iids\n"
+        "from pangeo_forge_esgf.recipe_inputs import get_urls_from_esgf as original\n"
+        "import logging\n"
+        "assert get_urls_from_esgf is original\n"
+        "assert logging.getLogger('backoff').level == logging.FATAL\n"
+        "assert set(pangeo_forge_esgf.__all__) <= set(dir(pangeo_forge_esgf))\n"
+        "print(json.dumps('aiohttp' in sys.modules))"
+    )
+    assert json.loads(run_python(code).stdout)
+
+
+def test_unknown_attribute():
+    import pangeo_forge_esgf
+
+    with pytest.raises(AttributeError):
+        pangeo_forge_esgf.not_a_function
+
+
+def test_import_time_benchmark(record_property):
+    """The package should import much faster than its heavy dependencies"""
+    # take the best of a few runs to reduce noise
+    package = min(cumulative_import_time("pangeo_forge_esgf") for _ in range(3))
+    aiohttp = min(cumulative_import_time("aiohttp") for _ in range(3))
+    record_property("import_time_pangeo_forge_esgf", package)
+    record_property("import_time_aiohttp", aiohttp)
+    assert package < aiohttp / 2
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import pytest
+from aiohttp import web
+
+from pangeo_forge_esgf import nodes
+from pangeo_forge_esgf.nodes import (
+    discover_search_nodes,
+    get_search_nodes,
+    parse_node_list,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    nodes._search_node_cache.clear()
+    yield
+    nodes._search_node_cache.clear()
+
+
+def run_discovery(local_server):
+    requests_seen = []
+
+    async def search(request):
+        requests_seen.append(request.path)
+        if request.path == "/dead/search":
+            return web.Response(status=503)
+        return web.Response(text=json.dumps({"response": {"numFound": 0}}))
+
+    async def main():
+        async with local_server("/{node}/search", search) as url:
+            host = nodes.strip_scheme(url)
+            candidates = [f"https://{host}/alive/search", f"{host}/dead/search"]
+            return await discover_search_nodes(candidates, timeout=5), host
+
+    search_nodes, host = asyncio.run(main())
+    return search_nodes, host
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        '["a.org/esg-search/search", "b.org/esg-search/search"]',
+        '{"search_nodes": ["a.org/esg-search/search", "b.org/esg-search/search"]}',
+        "# comment\na.org/esg-search/search\n\nb.org/esg-search/search\n",
+    ],
+)
+def test_parse_node_list(text):
+    assert parse_node_list(text) == [
+        "a.org/esg-search/search",
+        "b.org/esg-search/search",
+    ]
+
+
+def test_parse_node_list_invalid():
+    with pytest.raises(ValueError):
+        parse_node_list('"a.org"')
+
+
+def test_discover_search_nodes_picks_working_scheme(local_server):
+    search_nodes, host = run_discovery(local_server)
+    # the local server only speaks http, the dead node is dropped
+    assert search_nodes == [f"http://{host}/alive/search"]
+
+
+def test_discover_search_nodes_cache_file(tmp_path):
+    cache_file = str(tmp_path / "search_nodes.json")
+    candidates = ["a.org/esg-search/search"]
+    key = nodes._cache_key(candidates)
+    nodes._search_node_cache[key] = (0, ["http://a.org/esg-search/search"])
+    nodes._write_cache_file(cache_file, nodes._search_node_cache)
+    nodes._search_node_cache.clear()
+
+    # expired entries are not used
+    assert nodes._cached_search_nodes(key, ttl=60, cache_file=cache_file) is None
+    nodes._search_node_cache.clear()
+    result = asyncio.run(
+        discover_search_nodes(candidates, ttl=float("inf"), cache_file=cache_file)
+    )
+    assert result == ["http://a.org/esg-search/search"]
+
+
+def test_discover_search_nodes_registry_file(tmp_path, monkeypatch):
+    registry = tmp_path / "nodes.txt"
+    registry.write_text("a.org/esg-search/search\nhttps://b.org/esg-search/search\n")
+    probed = []
+
+    async def mock_probe_search_node(session, node, timeout=10):
+        probed.append(node)
+        return (len(probed), f"https://{nodes.strip_scheme(node)}")
+
+    registry_reads = []
+    read_node_list = nodes.read_node_list
+
+    async def mock_read_node_list(session, registry, timeout=10):
+        registry_reads.append(registry)
+        return await read_node_list(session, registry, timeout=timeout)
+
+    monkeypatch.setattr(nodes, "probe_search_node", mock_probe_search_node)
+    monkeypatch.setattr(nodes, "read_node_list", mock_read_node_list)
+    result = get_search_nodes(registry=str(registry))
+    assert probed == ["a.org/esg-search/search", "https://b.org/esg-search/search"]
+    assert result == [
+        "https://a.org/esg-search/search",
+        "https://b.org/esg-search/search",
+    ]
+    # second call is served from the cache, without reading the registry again
+    get_search_nodes(registry=str(registry))
+    assert len(probed) == 2
+    assert len(registry_reads) == 1
+
+
+def test_discover_search_nodes_concurrent_calls_probe_once(monkeypatch):
+    probed = []
+
+    async def mock_probe_search_node(session, node, timeout=10):
+        probed.append(node)
+        await asyncio.sleep(0.1)
+        return (0.1, f"https://{node}")
+
+    monkeypatch.setattr(nodes, "probe_search_node", mock_probe_search_node)
+    candidates = ["a.org/esg-search/search", "b.org/esg-search/search"]
+
+    async def main():
+        # one discovery in this event loop and several in threads with their own loops
+        return await asyncio.gather(
+            discover_search_nodes(candidates),
+            *[
+                asyncio.to_thread(get_search_nodes, candidates=candidates)
+                for _ in range(4)
+            ],
+        )
+
+    results = asyncio.run(main())
+    assert sorted(probed) == candidates
+    assert all(sorted(r) == [f"https://{c}" for c in candidates] for r in results)
@@ -68,3 +68,100 @@ def test_split_square_brackets(facet_iid, expected):
     from pangeo_forge_esgf.parsing import split_square_brackets
 
     assert split_square_brackets(facet_iid) == expected
+
+
+def test_facet_query_from_iid_pattern():
+    from pangeo_forge_esgf.parsing import facet_query_from_iid_pattern
+
+    query = facet_query_from_iid_pattern(
+        "CMIP6.[PMIP, CMIP].*.*.[lgm, historical].*.*.[uo, vo].*.v20200101"
+    )
+    assert query == {
+        "mip_era": ["CMIP6"],
+        "activity_id": ["PMIP", "CMIP"],
+        "experiment_id": ["lgm", "historical"],
+        "variable_id": ["uo", "vo"],
+        "version": ["20200101"],
+    }
+
+
+def test_facet_query_from_iid_pattern_wrong_length():
+    from pangeo_forge_esgf.parsing import facet_query_from_iid_pattern
+
+    with pytest.raises(ValueError):
+        facet_query_from_iid_pattern("a.[b1, b2].c")
+
+
+class MockResponse:
+    def __init__(self, docs, num_found):
+        self.status_code = 200
+        self.url = "mock"
+        self._json = {"response": {"docs": docs, "numFound": num_found}}
+
+    def json(self):
+        return self._json
+
+
+def test_parse_instance_ids_single_request_per_node(monkeypatch):
+    import requests
+    import pangeo_forge_esgf.parsing as parsing
+
+    all_iids = [
+        f"CMIP6.PMIP.AWI.AWI-ESM-1-1-LR.{exp}.r1i1p1f1.Omon.{var}.gn.v20200212"
+        for exp in ["lgm", "midHolocene"]
+        for var in ["uo", "vo"]
+    ]
+    calls = []
+
+    def mock_get(url, params):
+        calls.append((url, params))
+        offset = params["offset"]
+        docs = [{"instance_id": iid} for iid in all_iids[offset : offset + 3]]
+        return MockResponse(docs, len(all_iids))
+
+    monkeypatch.setattr(requests, "get", mock_get)
+    with pytest.warns(UserWarning, match="historical"):
+        iids = parsing.parse_instance_ids(
+            "CMIP6.PMIP.*.*.[lgm, midHolocene, historical].*.*.[uo, vo].*.*",
+            search_nodes=["node_a", "node_b"],
+        )
+    assert sorted(iids) == sorted(all_iids)
+    # two pages per node, instead of one request per expanded combination
+    assert [url for url, _ in calls] == ["node_a", "node_a", "node_b", "node_b"]
+    assert calls[0][1]["variable_id"] == ["uo", "vo"]
+
+
+def test_parse_instance_ids_keeps_pages_before_failure(monkeypatch, caplog):
+    import requests
+    import pangeo_forge_esgf.parsing as parsing
+
+    all_iids = [
+        f"CMIP6.PMIP.AWI.AWI-ESM-1-1-LR.lgm.r1i1p1f1.Omon.{var}.gn.v20200212"
+        for var in ["uo", "vo", "thetao", "so"]
+    ]
+
+    def mock_get(url, params):
+        offset = params["offset"]
+        if offset > 0:
+            raise requests.ConnectionError("connection reset")
+        docs = [{"instance_id": iid} for iid in all_iids[offset : offset + 2]]
+        return MockResponse(docs, len(all_iids))
+
+    monkeypatch.setattr(requests, "get", mock_get)
+    iids, complete = parsing.instance_ids_from_node("node_a", {})
+    assert not complete
+    assert sorted(iids) == sorted(all_iids[:2])
+
+    iids = parsing.parse_instance_ids(
+        "CMIP6.PMIP.*.*.lgm.*.*.*.*.*", search_nodes=["node_a"]
+    )
+    assert sorted(iids) == sorted(all_iids[:2])
+    assert "incomplete" in caplog.text
+
+
+def test_parse_instance_ids_no_responsive_nodes(monkeypatch):
+    from pangeo_forge_esgf import nodes
+
+    monkeypatch.setattr(nodes, "get_search_nodes", lambda **kwargs: [])
+    with pytest.raises(RuntimeError, match="are responsive"):
+        parse_instance_ids("CMIP6.PMIP.*.*.lgm.*.*.uo.*.*")
@@ -0,0 +1,137 @@
+import asyncio
+import aiohttp
+from contextlib import AsyncExitStack
+from aiohttp import web
+
+from pangeo_forge_esgf import probing
+
+from pangeo_forge_esgf.probing import (
+    DataNodeProbe,
+    filter_urls_fastest,
+    probe_throughput,
+    representative_urls,
+)
+
+
+def data_node(delay_per_chunk, requests_seen):
+    """Handler for a local stand-in of a data node, that ignores range requests and
+    streams chunks of 1 kB with a delay"""
+
+    async def serve_file(request):
+        requests_seen.append((request.path, request.headers.get("Range")))
+        if request.path.endswith("missing.nc"):
+            return web.Response(status=404)
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        for _ in range(1000):
+            await asyncio.sleep(delay_per_chunk)
+            await resp.write(b"x" * 1024)
+        return resp
+
+    return serve_file
+
+
+def test_representative_urls():
+    iid_url_tuple_list = [
+        ("iid|file_a.nc", ["http://a.org/file_a.nc", "http://b.org/file_a.nc"]),
+        ("iid|file_b.nc", ["http://b.org/file_b.nc", "http://c.org/file_b.nc"]),
+    ]
+    assert representative_urls(iid_url_tuple_list) == {
+        "a.org": "http://a.org/file_a.nc",
+        "b.org": "http://b.org/file_a.nc",
+        "c.org": "http://c.org/file_b.nc",
+    }
+
+
+def test_probe_throughput_byte_budget(local_server):
+    requests_seen = []
+
+    async def main():
+        async with local_server("/{filename}", data_node(0, requests_seen)) as url:
+            async with aiohttp.ClientSession() as session:
+                return await probe_throughput(
+                    session, asyncio.BoundedSemaphore(1), f"{url}/file.nc", 4096
+                )
+
+    score = asyncio.run(main())
+    assert score.ok
+    assert requests_seen == [("/file.nc", "bytes=0-4095")]
+    # the server ignores the range, but we stop reading after the budget
+    assert 4096 <= score.nbytes < 4096 + 2**16
+    assert score.ttfb > 0
+
+
+def test_data_node_probe_prefers_fastest_mirror(local_server):
+    requests_seen = []
+
+    async def main(slow, fast, broken):
+        iid_url_tuple_list = [
+            (
+                "iid|file_a.nc",
+                [f"{slow}/file_a.nc", f"{broken}/missing.nc", f"{fast}/file_a.nc"],
+            ),
+            ("iid|file_b.nc", [f"{slow}/file_b.nc", f"{fast}/file_b.nc"]),
+            ("iid|file_c.nc", [f"{slow}/file_c.nc"]),
+        ]
+        probe = DataNodeProbe(bytes_per_host=8 * 1024)
+        async with aiohttp.ClientSession() as session:
+            semaphore = asyncio.BoundedSemaphore(10)
+            await probe.probe(session, semaphore, iid_url_tuple_list)
+            # hosts are only probed once
+            await probe.probe(session, semaphore, iid_url_tuple_list)
+        return probe, iid_url_tuple_list
+
+    async def with_servers():
+        async with AsyncExitStack() as stack:
+            slow, fast, broken = [
+                await stack.enter_async_context(
+                    local_server("/{filename}", data_node(delay, requests_seen))
+                )
+                for delay in [0.05, 0, 0]
+            ]
+            return (*await main(slow, fast, broken), slow, fast)
+
+    probe, iid_url_tuple_list, slow, fast = asyncio.run(with_servers())
+    assert len(requests_seen) == 3
+    assert [score.ok for score in probe.scores.values()].count(False) == 1
+    assert filter_urls_fastest(iid_url_tuple_list, probe) == [
+        ("iid|file_a.nc", f"{fast}/file_a.nc"),
+        ("iid|file_b.nc", f"{fast}/file_b.nc"),
+        ("iid|file_c.nc", f"{slow}/file_c.nc"),
+    ]
+
+
+def test_data_node_probe_total_budget(monkeypatch):
+    calls = []
+
+    async def mock_probe_throughput(session, semaphore, url, nbytes, timeout, **kwargs):
+        calls.append(nbytes)
+        return probing.HostScore(host=probing.host_from_url(url), url=url)
+
+    monkeypatch.setattr(probing, "probe_throughput", mock_probe_throughput)
+    probe = DataNodeProbe(bytes_per_host=100, byte_budget=150)
+    urls = ["http://a.org/f.nc", "http://b.org/f.nc", "http://c.org/f.nc"]
+    asyncio.run(probe.probe(None, None, [("iid|f.nc", urls)]))
+    assert calls == [100, 50]
+    # unprobed hosts keep their order
+    assert probe.rank(urls) == urls
+
+
+def test_data_node_probe_reuse_across_event_loops(monkeypatch):
+    calls = []
+
+    async def mock_probe_throughput(session, semaphore, url, nbytes, timeout, **kwargs):
+        calls.append(url)
+        await asyncio.sleep(0)
+        return probing.HostScore(
+            host=probing.host_from_url(url), url=url, throughput=len(calls)
+        )
+
+    monkeypatch.setattr(probing, "probe_throughput", mock_probe_throughput)
+    probe = DataNodeProbe()
+    asyncio.run(probe.probe(None, None, [("iid|f.nc", ["http://a.org/f.nc"])]))
+    urls = ["http://a.org/g.nc", "http://b.org/g.nc"]
+    asyncio.run(probe.probe(None, None, [("iid|g.nc", urls)]))
+    # a.org is not probed again
+    assert calls == ["http://a.org/f.nc", "http://b.org/g.nc"]
+    assert probe.rank(urls) == ["http://b.org/g.nc", "http://a.org/g.nc"]
@@ -0,0 +1,332 @@
+"""Generated-data tests and benchmarks for the post-processing of search results.
+
+Synthetic Solr responses (with replicas, duplicate docs, missing files and multiple versions)
+are processed with the current implementations and with reference implementations (copies
+of the original, straightforward versions), which have to give identical outputs.
+The scaling tests record runtime and peak memory for growing inputs to catch quadratic behavior.
+Set `PANGEO_FORGE_ESGF_LARGE_SCALE_TESTS=1` to include inputs with 10^6 docs.
+"""
+
+import itertools
+import os
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from pangeo_forge_esgf.parsing import split_square_brackets
+from pangeo_forge_esgf.recipe_inputs import (
+    filter_urls_first,
+    flatten_iid_filename,
+    get_http,
+    get_unique_filenames,
+    group_iid_results,
+    nest_dict_from_keyed_list,
+    sort_urls_by_time,
+    url_result_processing,
+)
+
+scales = [10**3, 10**4, 10**5]
+if os.environ.get("PANGEO_FORGE_ESGF_LARGE_SCALE_TESTS"):
+    scales.append(10**6)
+
+
+## synthetic data
+def synthetic_iid_results(
+    n_docs: int,
+    seed: int,
+    n_search_nodes: int = 3,
+    n_data_nodes: int = 4,
+    duplicate_prob: float = 0.05,
+    missing_prob: float = 0.05,
+    version_prob: float = 0.0,
+) -> List[Dict[str, List[Dict[str, Any]]]]:
+    """Results as returned by `get_urls_for_iid`, one dict per (iid, search node),
+    with about `n_docs` docs in total."""
+    rng = random.Random(seed)
+    data_nodes = [f"esgf-data{i}.some.org" for i in range(n_data_nodes)]
+    iid_results = []
+    docs_total = 0
+    i = 0
+    while docs_total < n_docs:
+        iid = f"CMIP6.CMIP.INST.MODEL-{i}.historical.r1i1p1f1.Omon.tos.gn.v20200101"
+        prefix = f"tos_Omon_MODEL-{i}_historical_r1i1p1f1_gn"
+        n_files = rng.randint(1, 20)
+        filenames = [
+            f"{prefix}_{1850 + 10 * t}01-{1859 + 10 * t}12.nc" for t in range(n_files)
+        ]
+        if rng.random() < version_prob:
+            # a second version of a file with the same timestep
+            filenames.append(filenames[0].replace("MODEL-", "MODEL-v2-"))
+        replicas = {
+            f: rng.sample(data_nodes, rng.randint(1, n_data_nodes)) for f in filenames
+        }
+        for _ in range(rng.randint(1, n_search_nodes)):
+            docs = []
+            for f in filenames:
+                if rng.random() < missing_prob:
+                    continue
+                for data_node in replicas[f]:
+                    doc = {
+                        "id": f"{iid}.{f}|{data_node}",
+                        "url": [
+                            f"http://{data_node}/thredds/dodsC/{f}.html|application/opendap-html|OPENDAP",
+                            f"http://{data_node}/thredds/fileServer/{f}|application/netcdf|HTTPServer",
+                        ],
+                        "data_node": data_node,
+                    }
+                    docs.append(doc)
+                    if rng.random() < duplicate_prob:
+                        docs.append(dict(doc))
+            if len(docs) > 0:
+                iid_results.append({iid: docs})
+                docs_total += len(docs)
+        i += 1
+    return iid_results
+
+
+## reference implementations
+def reference_nest_dict_from_keyed_list(keyed_list, sep="|"):
+    new_dict: Dict[str, Any] = {}
+    for label, url in keyed_list:
+        iid, filename = label.split("|")
+        if iid not in new_dict.keys():
+            new_dict[iid] = {}
+        if filename not in new_dict[iid].keys():
+            new_dict[iid][filename] = url
+    return new_dict
+
+
+def reference_get_unique_filenames(iid_results):
+    filename_dict = {}
+    for result in iid_results:
+        for iid, res in result.items():
+            filenames = [r["id"].split("|")[0] for r in res]
+            sorted_unique_filenames = sorted(
+                set(filenames), key=lambda x: x.split("/")[-1]
+            )
+            unique_timesteps = set([f.split("_")[-1] for f in sorted_unique_filenames])
+            if len(unique_timesteps) != len(sorted_unique_filenames):
+                raise ValueError("Duplicate files found.")
+            filename_dict[iid] = sorted_unique_filenames
+    return filename_dict
+
+
+def reference_url_result_processing(flat_urls_per_file, expected_files):
+    filtered_dict = reference_nest_dict_from_keyed_list(flat_urls_per_file)
+    url_dict = {}
+    for iid in filtered_dict.keys():
+        if len(filtered_dict[iid]) == len(expected_files[iid]):
+            urls = list(filtered_dict[iid].values())
+            url_dict[iid] = sorted(urls, key=lambda x: x.split("/")[-1])
+    return url_dict
+
+
+def reference_split_square_brackets(facet_string):
+    options = [
+        [part.strip() for part in p[1:-1].split(",")] if p.startswith("[") else [p]
+        for p in facet_string.split(".")
+    ]
+    return [".".join(combination) for combination in itertools.product(*options)]
+
+
+def reference_pipeline(iid_results):
+    """Processing of all results at once, as `get_urls_from_esgf` originally did, except
+    that iids with invalid results (duplicate timesteps) are dropped instead of failing
+    all iids"""
+    expected_files = {}
+    invalid_iids = set()
+    for iid in {next(iter(r)) for r in iid_results}:
+        try:
+            expected_files.update(
+                reference_get_unique_filenames([r for r in iid_results if iid in r])
+            )
+        except ValueError:
+            invalid_iids.add(iid)
+    iid_results = [r for r in iid_results if next(iter(r)) not in invalid_iids]
+    group_dict: Dict[str, List[str]] = {}
+    for r_dict in iid_results:
+        for iid, r_list in r_dict.items():
+            for r in r_list:
+                group_dict.setdefault(flatten_iid_filename(iid, r), []).append(
+                    get_http(r["url"])
+                )
+    grouped = [(k, list(set(v))) for k, v in group_dict.items()]
+    first = [(k, urls[0]) for k, urls in grouped]
+    return reference_url_result_processing(first, expected_files)
+
+
+def current_pipeline(iid_results):
+    """Processing per iid, as `iter_urls_from_esgf` does"""
+    results_per_iid = defaultdict(list)
+    for r in iid_results:
+        results_per_iid[next(iter(r))].append(r)
+    url_dict = {}
+    for iid, results in results_per_iid.items():
+        try:
+            expected_files = get_unique_filenames(results)
+            grouped = group_iid_results(results)
+        except ValueError:
+            # the iid is yielded without urls, the other iids are not affected
+            continue
+        url_dict.update(
+            url_result_processing(filter_urls_first(grouped), expected_files)
+        )
+    return url_dict
+
+
+def run_or_error(func, *args):
+    try:
+        return func(*args)
+    except ValueError:
+        return ValueError
+
+
+def keyed_list(iid_results) -> List[Tuple[str, str]]:
+    return [
+        (flatten_iid_filename(iid, r), get_http(r["url"]))
+        for r_dict in iid_results
+        for iid, r_list in r_dict.items()
+        for r in r_list
+    ]
+
+
+## equivalence on generated data
+@pytest.mark.parametrize("seed", range(30))
+def test_pipeline_matches_reference(seed):
+    rng = random.Random(seed)
+    iid_results = synthetic_iid_results(
+        n_docs=rng.randint(1, 300),
+        seed=seed,
+        duplicate_prob=rng.choice([0, 0.2]),
+        missing_prob=rng.choice([0, 0.1, 0.5]),
+        version_prob=rng.choice([0, 0.1]),
+    )
+    expected = reference_pipeline(iid_results)
+    assert current_pipeline(iid_results) == expected
+    for iid, urls in expected.items():
+        assert urls == sort_urls_by_time(urls)
+        assert len(set(urls)) == len(urls)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_pipeline_drops_only_iids_with_duplicate_timesteps(seed):
+    iid_results = synthetic_iid_results(
+        n_docs=1000, seed=seed, missing_prob=0, version_prob=0.5
+    )
+    all_iids = {next(iter(r)) for r in iid_results}
+    duplicated_iids = {
+        iid
+        for r in iid_results
+        for iid, docs in r.items()
+        if any("MODEL-v2-" in doc["id"] for doc in docs)
+    }
+    assert 0 < len(duplicated_iids) < len(all_iids)
+    result = current_pipeline(iid_results)
+    assert set(result) == all_iids - duplicated_iids
+    assert result == reference_pipeline(iid_results)
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_get_unique_filenames_matches_reference(seed):
+    iid_results = synthetic_iid_results(
+        n_docs=200, seed=seed, duplicate_prob=0.2, version_prob=0.05
+    )
+    assert run_or_error(get_unique_filenames, iid_results) == run_or_error(
+        reference_get_unique_filenames, iid_results
+    )
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_nest_dict_from_keyed_list_matches_reference(seed):
+    keyed = keyed_list(synthetic_iid_results(n_docs=200, seed=seed, duplicate_prob=0.2))
+    random.Random(seed).shuffle(keyed)
+    assert nest_dict_from_keyed_list(keyed) == reference_nest_dict_from_keyed_list(
+        keyed
+    )
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_split_square_brackets_matches_reference(seed):
+    rng = random.Random(seed)
+    facets = []
+    for i in range(rng.randint(1, 10)):
+        if rng.random() < 0.3:
+            values = [f"v{i}_{j}" for j in range(rng.randint(1, 4))]
+            facets.append("[" + ", ".join(values) + "]")
+        else:
+            facets.append(rng.choice(["*", f"f{i}"]))
+    facet_string = ".".join(facets)
+    assert split_square_brackets(facet_string) == reference_split_square_brackets(
+        facet_string
+    )
+
+
+## scaling
+def measure(func, *args) -> Tuple[float, int]:
+    """Returns the best runtime (in s) of a few runs and the peak memory (in bytes) of `func`"""
+    runtimes = []
+    for _ in range(3):
+        start = time.perf_counter()
+        func(*args)
+        runtimes.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(runtimes), peak
+
+
+def check_scaling(measurements, record_property, name):
+    """Runtime and memory should grow roughly linearly: a quadratic implementation grows
+    100x per 10x input, we allow up to 30x (to leave room for noise and n log n)."""
+    for (n, (t, mem)), (n_next, (t_next, mem_next)) in zip(
+        measurements.items(), list(measurements.items())[1:]
+    ):
+        record_property(f"{name}_runtime_{n_next}", t_next)
+        record_property(f"{name}_peak_memory_{n_next}", mem_next)
+        factor = n_next / n
+        # runtimes below a millisecond are too noisy to compare
+        if t > 1e-3:
+            assert t_next / t < 3 * factor, f"{name}: runtime {t=} -> {t_next=}"
+        assert mem_next / max(mem, 1) < 3 * factor, (
+            f"{name}: memory {mem=} -> {mem_next=}"
+        )
+
+
+def test_pipeline_scaling(record_property):
+    measurements = {}
+    for n in scales:
+        iid_results = synthetic_iid_results(n_docs=n, seed=n)
+        measurements[n] = measure(current_pipeline, iid_results)
+    check_scaling(measurements, record_property, "pipeline")
+
+
+def test_nest_dict_from_keyed_list_scaling(record_property):
+    measurements = {}
+    for n in scales:
+        keyed = keyed_list(synthetic_iid_results(n_docs=n, seed=n, duplicate_prob=0.2))
+        measurements[n] = measure(nest_dict_from_keyed_list, keyed)
+    check_scaling(measurements, record_property, "nest_dict_from_keyed_list")
+
+
+def test_split_square_brackets_scaling(record_property):
+    measurements = {}
+    for n in scales:
+        # 10 values per bracket, i.e. n combinations
+        n_brackets = len(str(n)) - 1
+        facet_string = ".".join(
+            ["CMIP6"]
+            + [
+                "[" + ", ".join(f"v{i}{j}" for j in range(10)) + "]"
+                for i in range(n_brackets)
+            ]
+            + ["*"] * (9 - n_brackets)
+        )
+        measurements[n] = measure(split_square_brackets, facet_string)
+    check_scaling(measurements, record_property, "split_square_brackets")
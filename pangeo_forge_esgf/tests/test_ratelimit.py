@@ -0,0 +1,211 @@
+import asyncio
+import sqlite3
+import subprocess
+import sys
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from pangeo_forge_esgf import ratelimit
+from pangeo_forge_esgf.probing import DataNodeProbe
+from pangeo_forge_esgf.ratelimit import SharedRateLimiter
+from pangeo_forge_esgf.recipe_inputs import get_response_data, url_responsive
+from pangeo_forge_esgf.utils import host_from_url
+
+
+def test_host_from_url():
+    assert host_from_url("https://esgf-node.llnl.gov/esg-search/search") == (
+        "esgf-node.llnl.gov"
+    )
+    assert host_from_url("http://127.0.0.1:8080/search") == "127.0.0.1:8080"
+    assert host_from_url("esgf-node.llnl.gov") == "esgf-node.llnl.gov"
+
+
+def test_rates_keyed_by_url(tmp_path):
+    limiter = SharedRateLimiter(
+        tmp_path / "ratelimit.sqlite",
+        rates={"https://node.org/esg-search/search": 2},
+        default_rate=5,
+    )
+    assert limiter.rate("node.org") == 2
+    assert limiter.rate("other.org") == 5
+    assert limiter.capacity("other.org") == 5
+
+
+def test_try_acquire(tmp_path):
+    limiter = SharedRateLimiter(tmp_path / "ratelimit.sqlite", default_rate=1, burst=2)
+    assert limiter.try_acquire("node.org") == 0
+    assert limiter.try_acquire("node.org") == 0
+    assert 0 < limiter.try_acquire("node.org") <= 1
+    # buckets are independent per host
+    assert limiter.try_acquire("other.org") == 0
+
+
+def test_acquire_rate(tmp_path):
+    limiter = SharedRateLimiter(tmp_path / "ratelimit.sqlite", default_rate=20, burst=1)
+
+    async def main():
+        start = time.perf_counter()
+        await asyncio.gather(*[limiter.acquire("http://node.org/a") for _ in range(6)])
+        return time.perf_counter() - start
+
+    # the first token is available right away, the other 5 take 1/20 s each
+    assert asyncio.run(main()) >= 0.2
+
+
+def test_budget_shared_between_processes(tmp_path):
+    db = tmp_path / "ratelimit.sqlite"
+    SharedRateLimiter(db)
+    code = (
+        "import asyncio, sys\n"
+        "from pangeo_forge_esgf.ratelimit import SharedRateLimiter\n"
+        "limiter = SharedRateLimiter(sys.argv[1], default_rate=50, burst=1)\n"
+        "async def main():\n"
+        "    for _ in range(10):\n"
+        "        await limiter.acquire('http://node.org/search')\n"
+        "asyncio.run(main())\n"
+    )
+    start = time.perf_counter()
+    processes = [
+        subprocess.Popen([sys.executable, "-c", code, str(db)]) for _ in range(2)
+    ]
+    assert all(p.wait() == 0 for p in processes)
+    # 20 tokens at 50/s take at least 19/50 s, a single process would only need 9/50 s
+    assert time.perf_counter() - start >= 0.35
+
+
+def test_requests_acquire_tokens(tmp_path, local_server):
+    requests_seen = []
+    acquired = []
+
+    class RecordingRateLimiter(SharedRateLimiter):
+        async def acquire(self, url):
+            acquired.append(url)
+            await super().acquire(url)
+
+    async def search(request):
+        requests_seen.append(request.path)
+        return web.json_response(
+            {"response": {"numFound": 0, "docs": []}}, content_type="text/json"
+        )
+
+    async def main():
+        limiter = RecordingRateLimiter(tmp_path / "ratelimit.sqlite")
+        async with local_server("/search", search) as base_url:
+            url = f"{base_url}/search"
+            async with aiohttp.ClientSession() as session:
+                semaphore = asyncio.BoundedSemaphore(1)
+                await url_responsive(
+                    session, semaphore, url, timeout=10, rate_limiter=limiter
+                )
+                await get_response_data(
+                    session, semaphore, url, {}, timeout=10, rate_limiter=limiter
+                )
+        return url
+
+    url = asyncio.run(main())
+    assert acquired == [url, url]
+    assert requests_seen == ["/search", "/search"]
+
+
+def test_data_node_probes_acquire_tokens(tmp_path, local_server):
+    acquired = []
+
+    class RecordingRateLimiter(SharedRateLimiter):
+        async def acquire(self, url):
+            acquired.append(url)
+            await super().acquire(url)
+
+    async def serve_file(request):
+        return web.Response(body=b"x" * 1024)
+
+    async def main():
+        limiter = RecordingRateLimiter(tmp_path / "ratelimit.sqlite")
+        async with local_server("/{filename}", serve_file) as base_url:
+            url = f"{base_url}/file.nc"
+            async with aiohttp.ClientSession() as session:
+                await DataNodeProbe().probe(
+                    session,
+                    asyncio.BoundedSemaphore(1),
+                    [("iid|file.nc", [url])],
+                    rate_limiter=limiter,
+                )
+        return url
+
+    url = asyncio.run(main())
+    assert acquired == [url]
+
+
+def test_default_path_per_user():
+    assert ratelimit._user_name() in ratelimit.DEFAULT_RATE_LIMIT_DB
+
+
+def test_database_errors_do_not_fail_requests(tmp_path, monkeypatch, caplog):
+    limiter = SharedRateLimiter(tmp_path / "ratelimit.sqlite")
+
+    def readonly(host):
+        raise sqlite3.OperationalError("attempt to write a readonly database")
+
+    monkeypatch.setattr(limiter, "try_acquire", readonly)
+    asyncio.run(limiter.acquire("http://node.org/search"))
+    assert "readonly database" in caplog.text
+
+
+def test_waiting_for_tokens_does_not_block_other_hosts(tmp_path, local_server):
+    async def search(request):
+        return web.json_response(
+            {"response": {"numFound": 0, "docs": []}}, content_type="text/json"
+        )
+
+    async def main(slow, fast):
+        limiter = SharedRateLimiter(
+            tmp_path / "ratelimit.sqlite", rates={slow: 0.1}, burst=1
+        )
+        async with aiohttp.ClientSession() as session:
+            # a single concurrency slot
+            semaphore = asyncio.BoundedSemaphore(1)
+            await get_response_data(
+                session, semaphore, slow, {}, timeout=10, rate_limiter=limiter
+            )
+            # waits 10s for the next token of the slow host
+            waiting = asyncio.ensure_future(
+                get_response_data(
+                    session, semaphore, slow, {}, timeout=10, rate_limiter=limiter
+                )
+            )
+            await asyncio.sleep(0.1)
+            start = time.perf_counter()
+            await asyncio.wait_for(
+                get_response_data(
+                    session, semaphore, fast, {}, timeout=10, rate_limiter=limiter
+                ),
+                timeout=5,
+            )
+            elapsed = time.perf_counter() - start
+            waiting.cancel()
+            await asyncio.gather(waiting, return_exceptions=True)
+        return elapsed
+
+    async def with_servers():
+        async with local_server("/search", search) as slow:
+            async with local_server("/search", search) as fast:
+                return await main(f"{slow}/search", f"{fast}/search")
+
+    assert asyncio.run(with_servers()) < 1
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"rates": {"node.org": 0}},
+        {"rates": {"node.org": -1}},
+        {"default_rate": 0},
+        {"default_rate": float("nan")},
+        {"burst": 0.5},
+    ],
+)
+def test_invalid_rates(tmp_path, kwargs):
+    with pytest.raises(ValueError):
+        SharedRateLimiter(tmp_path / "ratelimit.sqlite", **kwargs)
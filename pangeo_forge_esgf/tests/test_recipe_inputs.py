@@ -1,8 +1,19 @@
+import asyncio
+import json
+import time
+
+import aiohttp
 import pytest
+from aiohttp import web
+from pangeo_forge_esgf import recipe_inputs
 from pangeo_forge_esgf.recipe_inputs import (
     sort_urls_by_time,
     get_unique_filenames,
     filter_urls_first,
+    iid_results_sufficient,
+    get_urls_for_iid_from_nodes,
+    get_urls_from_esgf,
+    iter_urls_from_esgf,
 )
 
 
@@ -94,3 +105,267 @@ def test_filter_first_file_urls():
     for i in range(len(expected)):
         for ii in range(2):
             assert filtered[i][ii] == expected[i][ii]
+
+
+def _node_result(iid, filenames, number_of_files, data_node="data.node.a"):
+    return {
+        iid: [
+            {"id": f"{f}|{data_node}", "number_of_files": number_of_files}
+            for f in filenames
+        ]
+    }
+
+
+@pytest.mark.parametrize(
+    "iid_results, min_confirming_nodes, expected",
+    [
+        ([_node_result("iid", ["a_2000.nc", "a_2001.nc"], 2)], 1, True),
+        ([_node_result("iid", ["a_2000.nc", "a_2001.nc"], 2)], 2, False),
+        ([_node_result("iid", ["a_2000.nc"], 2)], 1, False),
+        ([_node_result("iid", ["a_2000.nc", "a_2001.nc"], None)], 1, False),
+        (
+            [
+                _node_result("iid", ["a_2000.nc", "a_2001.nc"], 2),
+                _node_result("iid", ["a_2000.nc", "a_2001.nc"], 3),
+            ],
+            1,
+            False,
+        ),
+        (
+            [
+                _node_result("iid", ["a_2000.nc", "a_2001.nc"], 2),
+                _node_result("iid", ["a_2000.nc"], 2, data_node="data.node.b"),
+            ],
+            1,
+            True,
+        ),
+        (
+            [
+                _node_result("iid", ["a_2000.nc", "a_2001.nc"], 2),
+                _node_result("iid", ["b_2000.nc"], 2, data_node="data.node.b"),
+            ],
+            1,
+            False,
+        ),
+        ([_node_result("iid", ["a_2000.nc", "b_2000.nc"], 2)], 1, False),
+    ],
+)
+def test_iid_results_sufficient(iid_results, min_confirming_nodes, expected):
+    assert iid_results_sufficient(iid_results, min_confirming_nodes) == expected
+
+
+@pytest.mark.parametrize(
+    "sufficient, min_confirming_nodes, expected_nodes",
+    [
+        (False, 1, ["fast", "slow"]),
+        (True, 1, ["fast"]),
+        (True, 2, ["fast", "slow"]),
+    ],
+)
+def test_get_urls_for_iid_from_nodes_sufficient(
+    monkeypatch, sufficient, min_confirming_nodes, expected_nodes
+):
+    delays = {"fast": 0, "slow": 0.5}
+
+    async def mock_get_urls_for_iid(
+        session, semaphore, iid, node_url, timeout, **kwargs
+    ):
+        await asyncio.sleep(delays[node_url])
+        return _node_result(iid, ["a_2000.nc", "a_2001.nc"], 2, data_node=node_url)
+
+    async def mock_get_number_of_files(*args, **kwargs):
+        # no Dataset record, falls back to the number declared on the file records
+        return None
+
+    monkeypatch.setattr(recipe_inputs, "get_urls_for_iid", mock_get_urls_for_iid)
+    monkeypatch.setattr(recipe_inputs, "get_number_of_files", mock_get_number_of_files)
+    results = asyncio.run(
+        get_urls_for_iid_from_nodes(
+            None,
+            None,
+            "iid",
+            ["fast", "slow"],
+            timeout=10,
+            sufficient=sufficient,
+            min_confirming_nodes=min_confirming_nodes,
+        )
+    )
+    nodes = [r["iid"][0]["id"].split("|")[-1] for r in results]
+    assert nodes == expected_nodes
+
+
+def esgf_docs(record_type, iid, filenames, data_node):
+    """Docs in the shape returned by ESGF index nodes, `number_of_files` is only
+    part of the Dataset records"""
+    if record_type == "Dataset":
+        return [
+            {
+                "id": f"{iid}|{data_node}",
+                "instance_id": iid,
+                "number_of_files": len(filenames),
+            }
+        ]
+    return [
+        {
+            "id": f"{iid}.{f}|{data_node}",
+            "title": f,
+            "data_node": data_node,
+            "latest": True,
+            "replica": False,
+            "url": [
+                f"http://{data_node}/{f}|application/netcdf|HTTPServer",
+                f"http://{data_node}/{f}.html|application/opendap-html|OPENDAP",
+            ],
+        }
+        for f in filenames
+    ]
+
+
+def test_get_urls_for_iid_from_nodes_sufficient_dataset_record(local_server):
+    """The declared number of files comes from the Dataset record"""
+    iid = "CMIP6.CMIP.NCC.NorESM2-LM.historical.r1i1p1f1.Omon.vmo.gr.v20190815"
+    filenames = [
+        f"vmo_Omon_NorESM2-LM_historical_r1i1p1f1_gr_{t}.nc"
+        for t in ["185001-189912", "190001-194912"]
+    ]
+
+    def node(delay, data_node):
+        async def search(request):
+            if request.query["type"] == "File":
+                await asyncio.sleep(delay)
+            docs = esgf_docs(request.query["type"], iid, filenames, data_node)
+            return web.json_response(
+                {"response": {"numFound": len(docs), "docs": docs}},
+                content_type="text/json",
+            )
+
+        return search
+
+    async def main():
+        async with local_server("/search", node(0, "data.node.a")) as fast:
+            async with local_server("/search", node(2, "data.node.b")) as slow:
+                async with aiohttp.ClientSession() as session:
+                    start = time.perf_counter()
+                    results = await get_urls_for_iid_from_nodes(
+                        session,
+                        asyncio.BoundedSemaphore(10),
+                        iid,
+                        [f"{fast}/search", f"{slow}/search"],
+                        timeout=10,
+                        sufficient=True,
+                    )
+                    return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(main())
+    assert [r[iid][0]["data_node"] for r in results] == ["data.node.a"]
+    assert elapsed < 1.5
+
+
+def test_iter_urls_from_esgf_local_search_node(local_server):
+    """Resolve iids against a local stand-in for a search node"""
+    iid = "CMIP6.CMIP.NCC.NorESM2-LM.historical.r1i1p1f1.Omon.vmo.gr.v20190815"
+    missing_iid = iid.replace("vmo", "uo")
+    filenames = [
+        f"vmo_Omon_NorESM2-LM_historical_r1i1p1f1_gr_{t}.nc"
+        for t in ["190001-194912", "185001-189912"]
+    ]
+
+    async def search(request):
+        docs = []
+        if request.query.get("variable_id") == "vmo":
+            docs = esgf_docs(request.query["type"], iid, filenames, "data.node.a")
+        return web.Response(
+            text=json.dumps({"response": {"numFound": len(docs), "docs": docs}}),
+            content_type="text/json",
+        )
+
+    async def main():
+        async with local_server("/esg-search/search", search) as url:
+            kwargs = dict(
+                search_nodes=[f"{url}/esg-search/search"],
+                progress=None,
+                sufficient=True,
+            )
+            streamed = [
+                r async for r in iter_urls_from_esgf(iter([iid, missing_iid]), **kwargs)
+            ]
+            collected = await get_urls_from_esgf([iid, missing_iid], **kwargs)
+        return streamed, collected
+
+    streamed, collected = asyncio.run(main())
+    expected_urls = [f"http://data.node.a/{f}" for f in sorted(filenames)]
+    assert dict(streamed) == {iid: expected_urls, missing_iid: None}
+    assert collected == {iid: expected_urls}
+
+
+def test_iter_urls_from_esgf_invalid_results_do_not_abort(monkeypatch):
+    async def mock_filter_responsive_urls(session, semaphore, node_list, **kwargs):
+        return node_list
+
+    async def mock_get_urls_for_iid_from_nodes(session, semaphore, iid, *args, **kw):
+        filenames = [f"{iid}_2000.nc", f"{iid}_2001.nc"]
+        if iid == "bad":
+            # two versions of the same timestep
+            filenames.append(f"{iid}_v2_2000.nc")
+        return [
+            {
+                iid: [
+                    {"id": f, "url": [f"http://data.node.a/{f}|a|HTTPServer"]}
+                    for f in filenames
+                ]
+            }
+        ]
+
+    monkeypatch.setattr(
+        recipe_inputs, "filter_responsive_urls", mock_filter_responsive_urls
+    )
+    monkeypatch.setattr(
+        recipe_inputs, "get_urls_for_iid_from_nodes", mock_get_urls_for_iid_from_nodes
+    )
+
+    async def main():
+        return [
+            r
+            async for r in iter_urls_from_esgf(
+                ["good1", "bad", "good2"], search_nodes=["node"], progress=None
+            )
+        ]
+
+    results = dict(asyncio.run(main()))
+    assert results["bad"] is None
+    assert results["good1"] == [
+        "http://data.node.a/good1_2000.nc",
+        "http://data.node.a/good1_2001.nc",
+    ]
+    assert results["good2"] is not None
+
+
+def test_iter_urls_from_esgf_no_discovered_nodes(monkeypatch):
+    async def mock_discover_search_nodes(**kwargs):
+        return []
+
+    monkeypatch.setattr(
+        recipe_inputs, "discover_search_nodes", mock_discover_search_nodes
+    )
+
+    async def main():
+        return [r async for r in iter_urls_from_esgf(["iid"], progress=None)]
+
+    with pytest.raises(RuntimeError, match="esgf-node.llnl.gov"):
+        asyncio.run(main())
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{"max_concurrency": 0}, {"max_concurrency_response": 0}]
+)
+def test_get_urls_from_esgf_invalid_concurrency(kwargs):
+    with pytest.raises(ValueError):
+        asyncio.run(get_urls_from_esgf(["iid"], search_nodes=["node"], **kwargs))
+
+
+def test_iter_urls_from_esgf_unknown_choose_url():
+    async def main():
+        return [r async for r in iter_urls_from_esgf(["iid"], choose_url="slowest")]
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
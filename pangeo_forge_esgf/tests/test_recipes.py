@@ -0,0 +1,148 @@
+import asyncio
+import itertools
+import threading
+import time
+import pytest
+from pangeo_forge_esgf import recipes
+from pangeo_forge_esgf.recipes import (
+    time_range_from_filename,
+    variable_from_iid,
+    recipe_inputs_from_iids,
+    generate_recipe_inputs_from_iids,
+)
+
+iid = "CMIP6.CMIP.NCC.NorESM2-LM.historical.r1i1p1f1.Omon.vmo.gr.v20190815"
+urls = [
+    f"https://some_url/vmo_Omon_NorESM2-LM_historical_r1i1p1f1_gr_{t}.nc"
+    for t in ["185001-189912", "190001-194912"]
+]
+
+
+@pytest.mark.parametrize(
+    "filename, expected",
+    [
+        (urls[0], "185001-189912"),
+        ("tas_Amon_MIROC-ES2L_past1000_r1i1p1f2_gn_085001-184912.nc", "085001-184912"),
+        ("areacello_Ofx_NorESM2-LM_historical_r1i1p1f1_gn.nc", "gn"),
+    ],
+)
+def test_time_range_from_filename(filename, expected):
+    assert time_range_from_filename(filename) == expected
+
+
+def test_variable_from_iid():
+    assert variable_from_iid(iid, urls) == "vmo"
+    cmip5_iid = (
+        "cmip5.output1.MOHC.HadGEM2-ES.historical.mon.atmos.Amon.r1i1p1.v20120928"
+    )
+    cmip5_urls = [
+        "https://some_url/tas_Amon_HadGEM2-ES_historical_r1i1p1_185912-188411.nc"
+    ]
+    assert variable_from_iid(cmip5_iid, cmip5_urls) == "tas"
+
+
+def test_recipe_input_from_urls():
+    pytest.importorskip("pangeo_forge_recipes")
+    pattern = recipes.recipe_input_from_urls(iid, urls)
+    assert list(pattern.items()) == [(index, url) for index, url in zip(pattern, urls)]
+    assert [dim.name for dim in pattern.combine_dims] == ["variable", "time"]
+    assert pattern.combine_dims[0].keys == ["vmo"]
+
+
+def test_recipe_input_from_urls_duplicate_time_ranges():
+    pytest.importorskip("pangeo_forge_recipes")
+    with pytest.raises(ValueError):
+        recipes.recipe_input_from_urls(iid, urls + [urls[0].replace("some", "other")])
+
+
+@pytest.fixture
+def mock_resolution(monkeypatch):
+    """Resolve iids one by one, only continuing after the consumer received the previous iid"""
+    received = threading.Event()
+
+    async def mock_iter_urls_from_esgf(iids, **kwargs):
+        for i, iid in enumerate(iids):
+            if i > 0:
+                # wait (without blocking the loop) until the previous result was consumed
+                while not received.is_set():
+                    await asyncio.sleep(0.001)
+                received.clear()
+            yield iid, (None if iid == "missing" else [f"{iid}_{i}.nc"])
+
+    monkeypatch.setattr(recipes, "iter_urls_from_esgf", mock_iter_urls_from_esgf)
+    monkeypatch.setattr(
+        recipes, "recipe_input_from_urls", lambda iid, urls: f"pattern_for_{urls[0]}"
+    )
+    return received
+
+
+def test_recipe_inputs_from_iids_lazy(mock_resolution):
+    results = []
+    for item in recipe_inputs_from_iids(["a", "b", "missing"]):
+        results.append(item)
+        mock_resolution.set()
+    assert results == [("a", "pattern_for_a_0.nc"), ("b", "pattern_for_b_1.nc")]
+
+
+def test_recipe_inputs_from_iids_raises(monkeypatch):
+    async def mock_iter_urls_from_esgf(iids, **kwargs):
+        raise RuntimeError("None of the search nodes are responsive")
+        yield
+
+    monkeypatch.setattr(recipes, "iter_urls_from_esgf", mock_iter_urls_from_esgf)
+    with pytest.raises(RuntimeError):
+        list(recipe_inputs_from_iids(["a"]))
+
+
+@pytest.fixture
+def endless_resolution(monkeypatch):
+    """Resolve an endless stream of iids, counting the resolved ones"""
+    resolved = []
+
+    async def mock_iter_urls_from_esgf(iids, **kwargs):
+        for iid in iids:
+            resolved.append(iid)
+            await asyncio.sleep(0)
+            yield iid, [f"{iid}.nc"]
+
+    monkeypatch.setattr(recipes, "iter_urls_from_esgf", mock_iter_urls_from_esgf)
+    monkeypatch.setattr(recipes, "recipe_input_from_urls", lambda iid, urls: urls[0])
+    return resolved
+
+
+def test_recipe_inputs_from_iids_bounded_buffer(endless_resolution):
+    results = recipe_inputs_from_iids(itertools.count(), maxsize=3)
+    assert next(results) == (0, "0.nc")
+    time.sleep(0.3)
+    # one consumed, three buffered and one waiting for free space
+    assert len(endless_resolution) <= 5
+    results.close()
+
+
+def test_recipe_inputs_from_iids_stops_when_consumer_stops(endless_resolution):
+    for iid, _ in recipe_inputs_from_iids(itertools.count(), maxsize=3):
+        if iid == 1:
+            break
+    time.sleep(0.3)
+    n_resolved = len(endless_resolution)
+    time.sleep(0.3)
+    assert len(endless_resolution) == n_resolved
+
+
+def test_recipe_inputs_from_iids_base_exception(monkeypatch):
+    class Abort(BaseException):
+        pass
+
+    async def mock_iter_urls_from_esgf(iids, **kwargs):
+        raise Abort()
+        yield
+
+    monkeypatch.setattr(recipes, "iter_urls_from_esgf", mock_iter_urls_from_esgf)
+    with pytest.raises(RuntimeError):
+        list(recipe_inputs_from_iids(["a"]))
+
+
+def test_generate_recipe_inputs_from_iids(mock_resolution):
+    mock_resolution.set()  # do not wait in between iids
+    result = asyncio.run(generate_recipe_inputs_from_iids(["a"]))
+    assert result == {"a": "pattern_for_a_0.nc"}
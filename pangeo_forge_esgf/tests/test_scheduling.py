@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import pytest
+from pangeo_forge_esgf.scheduling import (
+    iter_bounded,
+    map_bounded,
+    get_progress_sink,
+    LoggingProgress,
+    NullProgress,
+    TqdmProgress,
+)
+
+
+def test_map_bounded_order_and_concurrency():
+    active = 0
+    max_active = 0
+
+    async def func(i):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.001 * (i % 3))
+        active -= 1
+        return i * 2
+
+    results = asyncio.run(map_bounded(func, range(100), n_workers=7))
+    assert results == [i * 2 for i in range(100)]
+    assert max_active == 7
+
+
+def test_iter_bounded_pulls_items_lazily():
+    pulled = 0
+
+    def items():
+        nonlocal pulled
+        for i in range(10_000):
+            pulled += 1
+            yield i
+
+    async def func(i):
+        return i
+
+    async def consume_some():
+        gen = iter_bounded(func, items(), n_workers=4)
+        async for index, _ in gen:
+            if index >= 10:
+                break
+        await gen.aclose()
+
+    asyncio.run(consume_some())
+    assert pulled < 100
+
+
+def test_map_bounded_raises():
+    async def func(i):
+        if i == 5:
+            raise RuntimeError("failed")
+        return i
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(map_bounded(func, range(10), n_workers=3))
+
+
+@pytest.mark.parametrize("n_workers", [0, -1])
+def test_map_bounded_invalid_n_workers(n_workers):
+    async def func(i):
+        return i
+
+    with pytest.raises(ValueError):
+        asyncio.run(map_bounded(func, range(5), n_workers=n_workers))
+
+
+def test_map_bounded_callback_progress():
+    calls = []
+
+    async def func(i):
+        return i
+
+    asyncio.run(
+        map_bounded(
+            func,
+            range(5),
+            n_workers=2,
+            progress=lambda *args: calls.append(args),
+            desc="stage",
+            total=5,
+        )
+    )
+    assert calls == [("stage", i, 5) for i in range(1, 6)]
+
+
+def test_logging_progress(caplog):
+    async def func(i):
+        return i
+
+    with caplog.at_level(logging.INFO, logger="pangeo_forge_esgf.scheduling"):
+        asyncio.run(
+            map_bounded(
+                func, range(25), n_workers=2, progress="logging", desc="stage", total=25
+            )
+        )
+    messages = [r.getMessage() for r in caplog.records]
+    assert messages[0] == "stage: 2/25"
+    assert messages[-1] == "stage: 25/25"
+
+
+@pytest.mark.parametrize(
+    "progress, expected",
+    [
+        (None, NullProgress),
+        (False, NullProgress),
+        ("tqdm", TqdmProgress),
+        ("logging", LoggingProgress),
+    ],
+)
+def test_get_progress_sink(progress, expected):
+    assert type(get_progress_sink(progress)) is expected
+
+
+def test_get_progress_sink_unknown():
+    with pytest.raises(ValueError):
+        get_progress_sink("rich")
+
+
+def test_map_bounded_async_iterable():
+    async def items():
+        for i in range(20):
+            await asyncio.sleep(0)
+            yield i
+
+    async def func(i):
+        await asyncio.sleep(0.001 * (i % 3))
+        return i * 2
+
+    results = asyncio.run(map_bounded(func, items(), n_workers=4))
+    assert results == [i * 2 for i in range(20)]
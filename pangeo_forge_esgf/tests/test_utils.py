@@ -1,6 +1,13 @@
 import pytest
 import requests
-from pangeo_forge_esgf.utils import facets_from_iid, CMIP6_naming_schema
+from pangeo_forge_esgf.utils import (
+    facets_from_iid,
+    facets_from_iids,
+    get_naming_schema,
+    normalize_facets,
+    normalize_version,
+    CMIP6_naming_schema,
+)
 
 
 def get_official_drs_naming_scheme():
@@ -52,3 +59,72 @@ def test_facets_from_iid_wrong_length():
     iid = "Just.three.facets"
     with pytest.raises(ValueError):
         facets_from_iid(iid)
+
+
+@pytest.mark.parametrize(
+    "iid, project, expected",
+    [
+        (
+            "CMIP6.CMIP.NCC.NorESM2-LM.historical.r1i1p1f1.Omon.vmo.gr.v20190815",
+            "CMIP6",
+            {"source_id": "NorESM2-LM", "variable_id": "vmo", "version": "20190815"},
+        ),
+        (
+            "cmip5.output1.MOHC.HadGEM2-ES.historical.mon.atmos.Amon.r1i1p1.v20120928",
+            "CMIP5",
+            {"model": "HadGEM2-ES", "cmor_table": "Amon", "version": "20120928"},
+        ),
+        (
+            "cordex.output.EUR-11.CLMcom.MPI-M-MPI-ESM-LR.rcp85.r1i1p1.CCLM4-8-17.v1.day.tas.v20140515",
+            "CORDEX",
+            {"domain": "EUR-11", "rcm_version": "v1", "version": "20140515"},
+        ),
+        (
+            "input4MIPs.CMIP6.CMIP.PCMDI.PCMDI-AMIP-1-1-6.ocean.mon.tos.gn.v20191121",
+            "input4MIPs",
+            {"mip_era": "CMIP6", "variable_id": "tos", "version": "20191121"},
+        ),
+    ],
+)
+def test_facets_from_iid_projects(iid, project, expected):
+    assert get_naming_schema(iid=iid).project == project
+    facets = facets_from_iid(iid)
+    for k, v in expected.items():
+        assert facets[k] == v
+
+
+def test_facets_from_iid_returns_copy():
+    iid = "CMIP6.CMIP.NCC.NorESM2-LM.historical.r1i1p1f1.Omon.vmo.gr.v20190815"
+    facets = facets_from_iid(iid)
+    facets["version"] = "modified"
+    assert facets_from_iid(iid)["version"] == "20190815"
+
+
+def test_facets_from_iids():
+    iids = [
+        "CMIP6.CMIP.NCC.NorESM2-LM.historical.r1i1p1f1.Omon.vmo.gr.v20190815",
+        "CMIP6.PMIP.MRI.MRI-ESM2-0.past1000.r1i1p1f1.Amon.tas.gn.v20200120",
+    ]
+    assert facets_from_iids(iids) == [facets_from_iid(iid) for iid in iids]
+    with pytest.raises(ValueError):
+        facets_from_iids(iids, project="CORDEX")
+
+
+def test_naming_schema_validate():
+    schema = get_naming_schema("CMIP6")
+    assert schema.validate(CMIP6_naming_schema)
+    assert not schema.validate("Just.three.facets")
+
+
+def test_get_naming_schema_unknown_project():
+    with pytest.raises(ValueError):
+        get_naming_schema("CMIP7")
+
+
+@pytest.mark.parametrize(
+    "version, expected",
+    [("v20190815", "20190815"), ("20190815", "20190815"), ("*", "*")],
+)
+def test_normalize_facets(version, expected):
+    assert normalize_facets({"version": version})["version"] == expected
+    assert normalize_version(version) == expected
@@ -1,22 +1,115 @@
-from typing import Dict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
 
 CMIP6_naming_schema = "mip_era.activity_id.institution_id.source_id.experiment_id.member_id.table_id.variable_id.grid_label.version"
+CMIP5_naming_schema = "project.product.institute.model.experiment.time_frequency.realm.cmor_table.ensemble.version"
+CORDEX_naming_schema = "project.product.domain.institute.driving_model.experiment.ensemble.rcm_name.rcm_version.time_frequency.variable.version"
+input4MIPs_naming_schema = "activity_id.mip_era.target_mip.institution_id.source_id.realm.frequency.variable_id.grid_label.version"
 
 
-def facets_from_iid(iid: str, fix_version: bool = True) -> Dict[str, str]:
-    """Translates iid string to facet dict according to CMIP6 naming scheme.
-    By default removes `v` from version
+class NamingSchema:
+    """Precompiled instance id template for a single ESGF project.
+
+    The template is split once on construction and parsed iids are memoized,
+    so repeated lookups of the same iid (e.g. once per search node) are cheap.
     """
-    iid_name_template = CMIP6_naming_schema
-    template_split = iid_name_template.split(".")
-    iid_split = iid.split(".")
-    if len(template_split) != len(iid_split):
+
+    def __init__(self, project: str, template: str, cache_size: int = 2**16):
+        self.project = project
+        self.template = template
+        self.facet_names: Tuple[str, ...] = tuple(template.split("."))
+        self._split = lru_cache(maxsize=cache_size)(self._split_uncached)
+
+    def __repr__(self) -> str:
+        return f"NamingSchema(project={self.project!r}, template={self.template!r})"
+
+    def _split_uncached(self, iid: str) -> Tuple[str, ...]:
+        iid_split = tuple(iid.split("."))
+        if len(iid_split) != len(self.facet_names):
+            raise ValueError(
+                f"Found {len(iid_split)} facets in `iid`, but expected {len(self.facet_names)}. Got {iid_split=}"
+            )
+        return iid_split
+
+    def validate(self, iid: str) -> bool:
+        """Check if `iid` has the number of facets this schema expects."""
+        try:
+            self._split(iid)
+        except ValueError:
+            return False
+        return True
+
+    def facets(self, iid: str, fix_version: bool = True) -> Dict[str, str]:
+        """Translates iid string to facet dict. By default removes `v` from version"""
+        facets = dict(zip(self.facet_names, self._split(iid)))
+        if fix_version:
+            facets = normalize_facets(facets)
+        return facets
+
+
+naming_schemas: Dict[str, NamingSchema] = {
+    "CMIP6": NamingSchema("CMIP6", CMIP6_naming_schema),
+    "CMIP5": NamingSchema("CMIP5", CMIP5_naming_schema),
+    "CORDEX": NamingSchema("CORDEX", CORDEX_naming_schema),
+    "input4MIPs": NamingSchema("input4MIPs", input4MIPs_naming_schema),
+}
+_schema_by_first_facet = {k.lower(): v for k, v in naming_schemas.items()}
+
+
+def schema_from_iid(iid: str) -> NamingSchema:
+    """Pick the naming schema based on the first facet of `iid`. Defaults to CMIP6."""
+    first_facet = iid.split(".", 1)[0].lower()
+    return _schema_by_first_facet.get(first_facet, naming_schemas["CMIP6"])
+
+
+def get_naming_schema(project: Optional[str] = None, iid: str = "") -> NamingSchema:
+    """Get a naming schema by project name, or detect it from `iid` if no project is given."""
+    if project is None:
+        return schema_from_iid(iid)
+    try:
+        return naming_schemas[project]
+    except KeyError:
         raise ValueError(
-            f"Found {len(iid_split)} facets in `iid`, but expected {len(template_split)}. Got {iid_split=}"
+            f"Unknown {project=}. Must be one of {list(naming_schemas.keys())}"
         )
-    facets = {}
-    for name, value in zip(template_split, iid_split):
-        facets[name] = value
-    if fix_version:
-        facets["version"] = facets["version"].replace("v", "")
+
+
+def normalize_version(version: str) -> str:
+    """The ESGF API expects versions without the leading `v` (`20200101` instead of `v20200101`)"""
+    return version[1:] if version.startswith("v") else version
+
+
+def normalize_facets(facets: Dict[str, str]) -> Dict[str, str]:
+    """Shared normalization of facet values before they are sent to the ESGF API.
+    Currently this only removes the leading `v` from the version.
+    """
+    version = facets.get("version")
+    if version is not None:
+        facets = {**facets, "version": normalize_version(version)}
     return facets
+
+
+def facets_from_iid(
+    iid: str, fix_version: bool = True, project: Optional[str] = None
+) -> Dict[str, str]:
+    """Translates iid string to facet dict according to the naming scheme of the project
+    (detected from the first facet if `project` is not given, CMIP6 by default).
+    By default removes `v` from version
+    """
+    return get_naming_schema(project, iid).facets(iid, fix_version=fix_version)
+
+
+def facets_from_iids(
+    iids: Iterable[str], fix_version: bool = True, project: Optional[str] = None
+) -> List[Dict[str, str]]:
+    """Batch version of `facets_from_iid`. Returns one facet record per iid."""
+    if project is not None:
+        schema = get_naming_schema(project)
+        return [schema.facets(iid, fix_version=fix_version) for iid in iids]
+    return [facets_from_iid(iid, fix_version=fix_version) for iid in iids]
+
+
+def host_from_url(url: str) -> str:
+    """Get the host (and port) of a url. Strings without a scheme are assumed to be a host already."""
+    return urlsplit(url).netloc if "://" in url else url